@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# Author: Haihong L.
+# License: MIT License
+#
+# DESCRIPTION:
+# This is a script that benchmarks ccindex.py on the bundled examples and on
+# generated headers of configurable size, reporting per-phase wall time, peak
+# memory and symbols per second. The results can be stored as JSON and
+# compared with those of a previous run.
+#
+# USAGE:
+#        ./benchmark.py
+#        ./benchmark.py --classes 200 --methods 20 --repeat 5 -json bench.json
+#        ./benchmark.py -json bench-new.json --compare bench.json
+# NOTE each case is run in a fresh process, so that its peak memory is not
+#      affected by the cases run before it.
+
+import sys, os, time
+import json, platform, resource
+import argparse, multiprocessing, shutil, tempfile
+
+import ccindex
+
+"""
+Benchmark configs
+"""
+
+# bump it if the result format changes
+BENCHMARK_FORMAT_VERSION = 1
+
+# the bundled examples: case name, file name relative to this script, user include paths
+example_cases = [
+    ("example-1", "example-1.cc", ["."]),
+    ("example-2", "example-2.h",  []),
+    ("example-3", "example-3.cc", ["."]),
+]
+
+"""
+Synthetic headers
+"""
+
+# N classes, each having M methods, plus a constructor and a destructor
+def _generate_classes_header(class_count, method_count):
+    lines = [ "#pragma once", "namespace bench {" ]
+    for i in range(class_count):
+        lines.append("/// class number %d" % i)
+        lines.append("class Class%d%s {" % (i, (" : public Class%d" % (i - 1)) if i else ""))
+        lines.append("public:")
+        lines.append("  Class%d();" % i)
+        lines.append("  virtual ~Class%d();" % i)
+        for j in range(method_count):
+            lines.append("  /// method number %d" % j)
+            lines.append("  virtual int method%d(int a, const float *b, char c = 'c') const;" % j)
+        lines.append("private:")
+        lines.append("  int field_%d;" % i)
+        lines.append("};")
+    lines.append("} // namespace bench")
+    return "\n".join(lines) + "\n"
+
+# namespaces nested D levels deep, each level having a class, a function and a variable
+def _generate_namespaces_header(depth):
+    lines = [ "#pragma once" ]
+    for i in range(depth):
+        lines.append("namespace level%d {" % i)
+        lines.append("struct Struct%d { int value; double ratio; };" % i)
+        lines.append("Struct%d make%d(int value);" % (i, i))
+        lines.append("extern int counter%d;" % i)
+    lines += [ "}" ] * depth
+    return "\n".join(lines) + "\n"
+
+# a chain of L typedefs, each aliasing the previous one, and functions using them
+def _generate_typedefs_header(chain_length):
+    lines = [ "#pragma once", "typedef int Alias0;" ]
+    for i in range(1, chain_length):
+        lines.append("typedef Alias%d Alias%d;" % (i - 1, i))
+    for i in range(chain_length):
+        lines.append("Alias%d *use%d(Alias%d value, Alias%d array[4]);" % (i, i, i, i))
+    return "\n".join(lines) + "\n"
+
+# write the synthetic headers to directory, return a list of (case name, file name, user include paths)
+def _generate_cases(directory, args):
+    generated = [
+        ("classes-%dx%d" % (args.classes, args.methods), "classes.h",
+         _generate_classes_header(args.classes, args.methods)),
+        ("namespaces-%d" % args.namespace_depth, "namespaces.h",
+         _generate_namespaces_header(args.namespace_depth)),
+        ("typedefs-%d" % args.typedef_chain, "typedefs.h",
+         _generate_typedefs_header(args.typedef_chain)),
+    ]
+    cases = []
+    for case_name, filename, content in generated:
+        path = os.path.join(directory, filename)
+        with open(path, 'w') as f:
+            f.write(content)
+        cases.append((case_name, path, []))
+    return cases
+
+"""
+Measurement
+"""
+
+# peak resident set size of this process, in megabytes
+def _get_peak_rss_mb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin": # in bytes on macOS, in kilobytes elsewhere
+        return peak_rss / 1024.0 / 1024.0
+    return peak_rss / 1024.0
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+# run in a fresh worker process; index the file repeat times, return the measurement dict
+def _run_case(benchmark_case):
+    case_name, filename, user_include_path_list, repeat = benchmark_case
+    rss_before = _get_peak_rss_mb()
+    runs = [] # list of dict
+    for _ in range(repeat):
+        start_time = time.time()
+        result = ccindex.get(filename, user_include_path_list)
+        runs.append({
+            "time_parsing": result["time_parsing"],
+            "time_traversing": result["time_traversing"],
+            "time_total": time.time() - start_time,
+        })
+    symbol_count = len(result["symbols"])
+    measurement = {
+        "name": case_name, # str
+        "file": os.path.basename(filename), # str
+        "symbols": symbol_count, # int
+        "errors": len(result["errors"]), # int
+        "repeat": repeat, # int
+        "peak_rss_mb": _get_peak_rss_mb(), # float, of the process indexing this case
+        "peak_rss_before_mb": rss_before, # float, of the process before indexing
+    }
+    # for each phase, min and median over the runs, in seconds
+    for phase in ("time_parsing", "time_traversing", "time_total"):
+        measurement[phase] = {
+            "min": min(run[phase] for run in runs),
+            "median": _median([ run[phase] for run in runs ]),
+        }
+    median_total = measurement["time_total"]["median"]
+    measurement["symbols_per_sec"] = (symbol_count / median_total) if median_total > 0 else None
+    return measurement
+
+def _run_cases(cases, repeat):
+    measurements = []
+    for case_name, filename, user_include_path_list in cases:
+        pool = multiprocessing.Pool(processes=1) # a fresh process per case
+        try:
+            measurement = pool.apply(_run_case, ((case_name, filename, user_include_path_list, repeat),))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        measurements.append(measurement)
+        _print_measurement(measurement)
+    return measurements
+
+"""
+Report
+"""
+
+def _print_measurement(measurement):
+    print("%-20s %6d symbols  parse %7.3f  traverse %7.3f  total %7.3f sec  %9.1f symbols/sec  %7.1f MB" % (
+        measurement["name"], measurement["symbols"],
+        measurement["time_parsing"]["median"], measurement["time_traversing"]["median"],
+        measurement["time_total"]["median"], measurement["symbols_per_sec"] or 0,
+        measurement["peak_rss_mb"]))
+
+# print the ratio new / old of the median times and peak memory, case by case
+def _print_comparison(old_report, new_report):
+    old_measurements = dict((m["name"], m) for m in old_report["cases"])
+    print("compared with %s:" % old_report["timestamp"])
+    for new in new_report["cases"]:
+        old = old_measurements.get(new["name"])
+        if not old:
+            print("%-20s (not in the previous run)" % new["name"])
+            continue
+        ratios = []
+        for phase in ("time_parsing", "time_traversing", "time_total"):
+            old_time = old[phase]["median"]
+            ratios.append(("%.2fx" % (new[phase]["median"] / old_time)) if old_time > 0 else "n/a")
+        print("%-20s parse %s  traverse %s  total %s  memory %.2fx%s" % (
+            new["name"], ratios[0], ratios[1], ratios[2], new["peak_rss_mb"] / old["peak_rss_mb"],
+            "" if new["symbols"] == old["symbols"] else "  (symbols: %d -> %d)" % (
+                old["symbols"], new["symbols"])))
+
+"""
+Commandline utility interface
+"""
+
+def _get_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Benchmark ccindex.py on the bundled examples and generated headers")
+    arg_parser.add_argument("--classes", type=int, default=100,
+                            help="number of classes in the generated header (default: 100)")
+    arg_parser.add_argument("--methods", type=int, default=10,
+                            help="number of methods in each generated class (default: 10)")
+    arg_parser.add_argument("--namespace-depth", type=int, default=50,
+                            help="depth of nested namespaces in the generated header (default: 50)")
+    arg_parser.add_argument("--typedef-chain", type=int, default=200,
+                            help="length of the typedef chain in the generated header (default: 200)")
+    arg_parser.add_argument("--repeat", type=int, default=3,
+                            help="number of times each case is indexed, the median is reported (default: 3)")
+    arg_parser.add_argument("--no-examples", action="store_true", default=False,
+                            help="only run the generated headers")
+    arg_parser.add_argument("-json", "--to-json", nargs='?', type=str, const="bench.json", default=None,
+                            help="write results to a JSON file (default: bench.json)")
+    arg_parser.add_argument("--compare", type=str, default=None,
+                            help="a JSON file written by a previous run, to compare with")
+    return arg_parser
+
+if __name__ == "__main__":
+    args = _get_arg_parser().parse_args()
+    if args.repeat < 1:
+        print("[Error] --repeat must be at least 1")
+        sys.exit(1)
+    old_report = None
+    if args.compare:
+        with open(args.compare) as f:
+            old_report = json.load(f)
+        if old_report.get("version") != BENCHMARK_FORMAT_VERSION:
+            print("[Error] %s has a different format version" % args.compare)
+            sys.exit(1)
+
+    if args.to_json:
+        args.to_json = os.path.abspath(args.to_json) # not affected by changing directory below
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    cases = []
+    if not args.no_examples:
+        # paths relative to the script's directory, as the examples include each other by relative paths
+        os.chdir(script_dir)
+        cases += example_cases
+    generated_dir = tempfile.mkdtemp(prefix="ccindex-bench-")
+    try:
+        cases += _generate_cases(generated_dir, args)
+        measurements = _run_cases(cases, args.repeat)
+    finally:
+        shutil.rmtree(generated_dir, ignore_errors=True)
+
+    report = {
+        "version": BENCHMARK_FORMAT_VERSION, # int
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), # str
+        "python": platform.python_version(), # str
+        "platform": platform.platform(), # str
+        "config": {
+            "classes": args.classes,
+            "methods": args.methods,
+            "namespace_depth": args.namespace_depth,
+            "typedef_chain": args.typedef_chain,
+            "repeat": args.repeat,
+        },
+        "cases": measurements, # list of dict
+    }
+    if args.to_json:
+        with open(args.to_json, 'w') as json_file: # overwrite if exists
+            json.dump(report, json_file, indent=2, sort_keys=True)
+    if old_report:
+        _print_comparison(old_report, report)
@@ -18,12 +18,34 @@
 # 2) as a commandline tool, store as JSON:
 #        ./ccindex.py path/file.[h|cc]
 #        ./ccindex.py path/file.[h|cc] -i UserIncludeDir1,UserIncludeDir2 -json out.json
+#    or as JSON Lines, written as symbols are visited, one symbol per line:
+#        ./ccindex.py path/file.[h|cc] -i UserIncludeDir1,UserIncludeDir2 -jsonl out.jsonl
 # 3) as a commandline tool, store as SQLite database:
 #        ./ccindex.py path/file.[h|cc]
 #        ./ccindex.py path/file.[h|cc] -i UserIncludeDir1,UserIncludeDir2 -db out.db
-# 4) as Python library (import ccindex):
+# 4) as a commandline tool, index many files in parallel (files, directories, globs or
+#    compile_commands.json), optionally storing one JSON file per source file:
+#        ./ccindex.py -b src/ include/*.h -i include -j 8 -o out_dir
+#    with the flags of each file in a compilation database, instead of -i:
+#        ./ccindex.py path/file.cc -p build/compile_commands.json
+#        ./ccindex.py -b build/compile_commands.json -j 8 -o out_dir
+# 5) as a server, keeping parsed files in memory and reparsing them when changed, answering
+#    JSON-RPC requests (one per line) on stdin/stdout or on a Unix socket:
+#        ./ccindex.py --serve -i UserIncludeDir1 [--socket /tmp/ccindex.sock]
+#        request:  {"jsonrpc": "2.0", "id": 1, "method": "index", "params": {"filename": "path/file.h"}}
+#        response: {"jsonrpc": "2.0", "id": 1, "result": {...}}, the result is as with -json
+# 6) as Python library (import ccindex):
 #        result = ccindex.get("path/file.h", ["UserIncludeDir1", "UserIncludeDir2"])
 #        the return is a dict
+#        for record in ccindex.iter_records("path/file.h", ["UserIncludeDir1"]):
+#            ... # a JSON Lines record: a symbol dict, or other top-level fields after the symbols
+#        for symbol in ccindex.iter_symbols("path/file.h", ["UserIncludeDir1"]):
+#            ... # a read-only mapping like a symbol dict, whose fields are computed when accessed
+#        indexer = ccindex.Indexer(["UserIncludeDir1"]) # for many files with the same options
+#        result = indexer.get("path/file.h")
+#        for filename, result, failure in ccindex.get_batch(["a.h", "b.cc"], ["UserIncludeDir1"]):
+#            ... # results arrive in completion order; result is None if failure is not None
+#    with fields=["spelling", "kind", ...] or --fields spelling,kind,..., only these fields are computed
 # NOTE if the source file includes headers, header directories must be specified
 #      with the "-i" option, otherwise some symbols won't be recognized.
 #
@@ -31,19 +53,22 @@
 # only on macOS; for Linux, modify LIBCLANG_PATH_CANDIDATES and SYS_INCLUDE_PATHS
 
 import sys, os, time
-import re, json
-import argparse
+import re, json, collections, bisect
+import glob, errno
 try:
-    import clang.cindex as cindex # pip install clang
-except:
-    print("[Error] module 'cindex' required, install: pip install clang")
-    sys.exit(1)
+    from collections.abc import Mapping # Python3
+except ImportError:
+    from collections import Mapping # Python2
+# modules needed only by some features (e.g. multiprocessing, sqlite3) are imported where used, so that
+# importing this module is fast; clang.cindex is imported by _load_libclang() before the first parse
+cindex = None
 
 """
 User configs
 """
 
-# for libclang.dylib -- required
+# for libclang.dylib (or libclang.so) -- searched first, after the directory in environment variable
+# LIBCLANG_PATH; then the directory given by llvm-config, and common_libclang_dirs below
 LIBCLANG_PATH_CANDIDATES = [
     "/Library/Developer/CommandLineTools/usr/lib"
     # or your locally-compiled libclang path
@@ -56,60 +81,321 @@ SYS_INCLUDE_PATHS = [
     "/Library/Developer/CommandLineTools/usr/include/c++/v1",
     "/usr/include"
 ]
+# max number of source files kept in memory for text extraction, shared across runs
+SOURCE_BUFFER_CACHE_SIZE = 64
+# max total size of the on-disk result cache (if a cache directory is given), in megabytes
+CACHE_MAX_SIZE_MB = 1024
+# number of symbols whose rows are inserted into the SQLite database at a time
+DB_INSERT_BATCH_SIZE = 500
+# in server mode, max number of translation units kept parsed in memory, reparsed when files change
+WARM_TU_CACHE_SIZE = 16
+# with parallel traversal, number of chunks of the target file's top-level declarations per worker process;
+# more chunks balance the load better, each chunk costs a round trip to a worker
+TRAVERSE_CHUNKS_PER_JOB = 4
 
-found_candidate = False
-for candidate in LIBCLANG_PATH_CANDIDATES:
-    if os.path.isdir(candidate):
-        found_candidate = True
-        cindex.Config.set_library_path(candidate)
-if not found_candidate:
-    print("[Error] library path of libclang not found")
-    sys.exit(1)
-
-interested_CursorKinds = [
-    cindex.CursorKind.NAMESPACE,
-    cindex.CursorKind.CONSTRUCTOR,
-    cindex.CursorKind.DESTRUCTOR,
-    cindex.CursorKind.CXX_METHOD,
-    cindex.CursorKind.CONVERSION_FUNCTION,
-    cindex.CursorKind.FUNCTION_TEMPLATE,
-    cindex.CursorKind.CLASS_TEMPLATE,
-    cindex.CursorKind.ENUM_DECL,
-    cindex.CursorKind.ENUM_CONSTANT_DECL,
-    cindex.CursorKind.FIELD_DECL,
-    cindex.CursorKind.CLASS_DECL,
-    cindex.CursorKind.STRUCT_DECL,
-    cindex.CursorKind.FUNCTION_DECL,
-    cindex.CursorKind.VAR_DECL,
-    cindex.CursorKind.TYPEDEF_DECL,
-    cindex.CursorKind.TYPE_ALIAS_DECL,
-    # ...
+"""
+Loading libclang
+"""
+
+# searched after LIBCLANG_PATH_CANDIDATES, in this order; "llvm-*" the newest version first
+common_libclang_dirs = [
+    "/usr/lib/llvm-*/lib",
+    "/usr/lib/x86_64-linux-gnu",
+    "/usr/lib/aarch64-linux-gnu",
+    "/usr/lib64",
+    "/usr/lib",
+    "/usr/local/lib",
 ]
+libclang_filename_patterns = [ "libclang.dylib", "libclang.so", "libclang.so.*", "libclang-*.so*", "libclang.dll" ]
+
+_libclang_loaded = False
+
+def _has_libclang(directory):
+    return any(glob.glob(os.path.join(directory, pattern)) for pattern in libclang_filename_patterns)
+
+def _get_llvm_config_libdir(): # return str, or None if llvm-config is not found
+    import subprocess # only needed if libclang is not found elsewhere
+    try:
+        output = subprocess.check_output([ "llvm-config", "--libdir" ], stderr=open(os.devnull, 'w'))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode("utf-8").strip() or None
+
+def _version_sort_key(path): # e.g. "/usr/lib/llvm-18/lib" after "/usr/lib/llvm-9/lib"
+    return [ int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path) ]
+
+# yield the directories that may have libclang, in the order of preference
+def _get_libclang_dir_candidates():
+    if os.environ.get("LIBCLANG_PATH"):
+        yield os.environ["LIBCLANG_PATH"]
+    for candidate in LIBCLANG_PATH_CANDIDATES:
+        yield candidate
+    if cindex.Config.library_path: # e.g. the one bundled with pip package libclang
+        yield cindex.Config.library_path
+    llvm_config_libdir = _get_llvm_config_libdir()
+    if llvm_config_libdir:
+        yield llvm_config_libdir
+    for pattern in common_libclang_dirs:
+        for candidate in sorted(glob.glob(pattern), key=_version_sort_key, reverse=True):
+            yield candidate
+
+# import clang.cindex, find and load libclang, and build the kind tables, once before the first parse, so
+# that importing this module does none of them (e.g. to read cached or stored results); if no candidate
+# directory has libclang, clang.cindex's default is tried; raise ImportError if either is not found
+def _load_libclang():
+    global _libclang_loaded, cindex
+    if _libclang_loaded:
+        return
+    try:
+        import clang.cindex as cindex # pip install clang
+    except ImportError:
+        raise ImportError("module 'cindex' required, install: pip install clang")
+    if not cindex.Config.loaded: # e.g. the library path has been set by the user
+        for candidate in _get_libclang_dir_candidates():
+            if os.path.isdir(candidate) and _has_libclang(candidate):
+                cindex.Config.set_library_path(candidate)
+                break
+        try:
+            cindex.conf.lib # loads it
+        except cindex.LibclangError:
+            raise ImportError("library path of libclang not found, set environment variable LIBCLANG_PATH "
+                              "or LIBCLANG_PATH_CANDIDATES in ccindex.py")
+    _build_kind_tables()
+    _libclang_loaded = True
+
+"""
+Kind tables
+"""
+
+# sets of cindex.CursorKind or cindex.TypeKind, built by _build_kind_tables() when libclang is loaded
+interested_CursorKinds = frozenset() # the kinds of symbols
+func_like_CursorKind = frozenset()   # function-like
+method_like_CursorKind = frozenset() # method-like
+class_like_CursorKind = frozenset()  # class-like
+val_like_CursorKind = frozenset()    # value-like
+sized_CursorKind = frozenset()       # value-like, class and struct, which have "size"
+type_alias_CursorKind = frozenset()  # typedef and using
+array_TypeKind = frozenset()
+pointer_TypeKind = frozenset()
+alias_TypeKind = frozenset()         # types named by an alias, maybe elaborated
+alias_or_compound_TypeKind = frozenset() # alias, array and pointer types
+no_return_funcs_CursorKindCursorKind = frozenset() # no return type
+noexcept_ExceptionSpecificationKind = frozenset()
+# dict, key: field group name, value: the kinds the group visits; a group not in it visits every kind
+field_group_CursorKinds = {}
+
+def _build_kind_tables():
+    global interested_CursorKinds, func_like_CursorKind, method_like_CursorKind, class_like_CursorKind
+    global val_like_CursorKind, sized_CursorKind, type_alias_CursorKind
+    global array_TypeKind, pointer_TypeKind, alias_TypeKind, alias_or_compound_TypeKind
+    global no_return_funcs_CursorKindCursorKind, noexcept_ExceptionSpecificationKind, field_group_CursorKinds
+    interested_CursorKinds = frozenset([
+        cindex.CursorKind.NAMESPACE,
+        cindex.CursorKind.CONSTRUCTOR,
+        cindex.CursorKind.DESTRUCTOR,
+        cindex.CursorKind.CXX_METHOD,
+        cindex.CursorKind.CONVERSION_FUNCTION,
+        cindex.CursorKind.FUNCTION_TEMPLATE,
+        cindex.CursorKind.CLASS_TEMPLATE,
+        cindex.CursorKind.ENUM_DECL,
+        cindex.CursorKind.ENUM_CONSTANT_DECL,
+        cindex.CursorKind.FIELD_DECL,
+        cindex.CursorKind.CLASS_DECL,
+        cindex.CursorKind.STRUCT_DECL,
+        cindex.CursorKind.FUNCTION_DECL,
+        cindex.CursorKind.VAR_DECL,
+        cindex.CursorKind.TYPEDEF_DECL,
+        cindex.CursorKind.TYPE_ALIAS_DECL,
+        # ...
+    ])
+
+    func_like_CursorKind = frozenset([ # function-like
+        cindex.CursorKind.FUNCTION_DECL,
+        cindex.CursorKind.FUNCTION_TEMPLATE,
+        cindex.CursorKind.CONVERSION_FUNCTION,
+        cindex.CursorKind.CONSTRUCTOR,
+        cindex.CursorKind.DESTRUCTOR,
+        cindex.CursorKind.CXX_METHOD,
+    ])
+
+    method_like_CursorKind = frozenset([ # method-like
+        cindex.CursorKind.CXX_METHOD,
+        cindex.CursorKind.CONVERSION_FUNCTION, # only valid for class, e.g. MyClass::operator int();
+        cindex.CursorKind.CONSTRUCTOR,
+        cindex.CursorKind.DESTRUCTOR,
+        # FUNCTION_TEMPLATE -- needs to check semantic_parent
+    ])
+
+    class_like_CursorKind = frozenset([ # class-like
+        cindex.CursorKind.CLASS_DECL,
+        cindex.CursorKind.STRUCT_DECL,
+        cindex.CursorKind.CLASS_TEMPLATE,
+    ])
+
+    val_like_CursorKind = frozenset([ # value-like
+        cindex.CursorKind.VAR_DECL,
+        cindex.CursorKind.FIELD_DECL,
+        cindex.CursorKind.ENUM_CONSTANT_DECL,
+    ])
+
+    array_TypeKind = frozenset([
+        # 1) int arr[5]; int arr[] = {..}; int arr[expr] where expr is an Integral Constant Expression
+        cindex.TypeKind.CONSTANTARRAY,
+        # 2) int arr[], as a function formal arg
+        cindex.TypeKind.INCOMPLETEARRAY,
+        # 3) int arr[expr]; where expr is not an Integral Constant Expression
+        cindex.TypeKind.VARIABLEARRAY,
+        # 4) size unknown until template instantiation, then it becomes either 1) or 3)
+        cindex.TypeKind.DEPENDENTSIZEDARRAY,
+    ])
+
+    pointer_TypeKind = frozenset([
+        cindex.TypeKind.POINTER,       # 1) int *p = &n; Class *p = &objClass; int (*p)(int) = &func;
+        cindex.TypeKind.MEMBERPOINTER, # 2) int Class::* p = &Class::member; int (Class::* p)(int) = &Class::method;
+    ])
+
+    sized_CursorKind = val_like_CursorKind | frozenset([
+        cindex.CursorKind.CLASS_DECL,
+        cindex.CursorKind.STRUCT_DECL,
+    ])
+
+    type_alias_CursorKind = frozenset([
+        cindex.CursorKind.TYPEDEF_DECL,
+        cindex.CursorKind.TYPE_ALIAS_DECL,
+    ])
+
+    alias_TypeKind = frozenset([
+        cindex.TypeKind.TYPEDEF,
+        cindex.TypeKind.ELABORATED,
+    ])
+
+    alias_or_compound_TypeKind = alias_TypeKind | array_TypeKind | pointer_TypeKind
+
+    no_return_funcs_CursorKindCursorKind = frozenset([ # no return type
+        cindex.CursorKind.CONSTRUCTOR,
+        cindex.CursorKind.DESTRUCTOR,
+    ])
+
+    noexcept_ExceptionSpecificationKind = frozenset([
+        cindex.ExceptionSpecificationKind.DYNAMIC_NONE,   # throw(), not recommended since C++11
+        cindex.ExceptionSpecificationKind.BASIC_NOEXCEPT, # noexcept
+    ])
+
+    field_group_CursorKinds = {
+        "proto": func_like_CursorKind | class_like_CursorKind,
+        "type": sized_CursorKind,
+        "type_alias": type_alias_CursorKind,
+        "method": method_like_CursorKind | frozenset([ cindex.CursorKind.FUNCTION_TEMPLATE ]),
+        "static_member": frozenset([ cindex.CursorKind.VAR_DECL, cindex.CursorKind.FIELD_DECL ]),
+        "enum": frozenset([ cindex.CursorKind.ENUM_DECL, cindex.CursorKind.ENUM_CONSTANT_DECL ]),
+    }
+
+"""
+Source buffers
+"""
+
+# key: file name, value: source buffer dict, least recently used first
+_source_buffers = collections.OrderedDict()
+
+def _load_source_buffer(file_name):
+    stat = os.stat(file_name)
+    with open(file_name, "rb") as f:
+        content = f.read() # read once, columns reported by libclang are byte offsets
+    return {
+        "content": content, # bytes
+        # line_offsets[i] is the offset of the first byte of row i + 1
+        "line_offsets": [0] + [ m.end() for m in re.finditer(b"\n", content) ],
+        "signature": (stat.st_mtime, stat.st_size),
+    }
+
+def _get_source_buffer(file_name):
+    source_buffer = _source_buffers.pop(file_name, None)
+    if source_buffer == None:
+        source_buffer = _load_source_buffer(file_name)
+        while len(_source_buffers) >= max(SOURCE_BUFFER_CACHE_SIZE, 1):
+            _source_buffers.popitem(last=False) # evict the least recently used
+    _source_buffers[file_name] = source_buffer # (re-)insert as the most recently used
+    return source_buffer
+
+def _get_file_signature(file_name): # return tuple (mtime, size), or None if not found
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+def _refresh_source_buffers(): # drop buffers of files modified since loaded
+    for file_name, source_buffer in list(_source_buffers.items()):
+        if _get_file_signature(file_name) != source_buffer["signature"]:
+            del _source_buffers[file_name]
 
 """
 Formatting
 """
 
+# in one pass over the comment: remove "*/" anywhere, and from the beginning of each line, in this order,
+# "/**", "/*< " and " * " (any whitespace before the asterisk)
+comment_decoration_pattern = re.compile(r"\*/|^(?:/\*\*)?(?:/\*< )?(?:[^\S\n]*\* )?", re.MULTILINE)
+# the decoration left at the beginning of a line, e.g. "///", "//!<", or a lone "*"
+doxygen_line_prefix_pattern = re.compile(r"\s*(?://[/!]<?|\*(?=\s|$))?\s*")
+# a Doxygen command line, e.g. "@param[in] name description", "\return description", "/// @brief description"
+doxygen_command_pattern = re.compile(
+    doxygen_line_prefix_pattern.pattern
+    + r"[@\\](param|tparam|returns?|throws?|exception|brief)\b(?:\[([a-z, ]+)\])?\s*(.*)")
+doxygen_named_commands = { "param": "params", "tparam": "tparams", "throw": "throws", "throws": "throws",
+                           "exception": "throws" } # the command's first word is a name
+
+# return tuple (entire comment str, usage block str, Doxygen dict or None), see schema.md
 def _format_comment(raw_comment):
     if raw_comment == None:
-        return "", ""
-    comment_lines = []
+        return "", "", None
+    content = comment_decoration_pattern.sub("", raw_comment)
+    if "Usage:" not in content and "@" not in content and "\\" not in content:
+        return content.strip(), "", None # no usage block, nor Doxygen command
     inside_usage_block = False
     usage_lines = []
-    for line in raw_comment.split("\n"):
-        line = re.sub(r"\A\/\*\*", "", line)
-        line = re.sub(r"\A\/\*\< ", "", line)
-        line = re.sub(r"\A\s*\* ", "", line)
-        line = re.sub(r"\*\/", "", line)
-        comment_lines.append(line)
-        if line.strip().startswith("Usage:"):
+    doxygen = None
+    description_lines = None # list of str, the lines of the current Doxygen command's description
+    for line in content.split("\n"):
+        stripped_line = line.strip()
+        if stripped_line.startswith("Usage:"):
             inside_usage_block = True
-        if line.strip().startswith("-----"):
+        if stripped_line.startswith("-----"):
             inside_usage_block = False
+            description_lines = None
         if inside_usage_block:
             usage_lines.append(line.replace("Usage:", "").lstrip())
-    entire_content = '\n'.join(comment_lines).strip()
-    return entire_content, "\n".join(usage_lines)
+            description_lines = None
+            continue
+        command_match = doxygen_command_pattern.match(line)
+        if command_match:
+            if doxygen == None:
+                doxygen = { "brief": "", "params": [], "tparams": [], "returns": "", "throws": [] }
+            command, direction, text = command_match.groups()
+            if command in doxygen_named_commands:
+                name_and_text = text.split(None, 1) + [ "", "" ]
+                description_lines = [ name_and_text[1] ]
+                entry = { "name": name_and_text[0], "description": description_lines } # lines joined below
+                if command == "param":
+                    entry["direction"] = direction.replace(" ", "") if direction else None
+                doxygen[doxygen_named_commands[command]].append(entry)
+            else: # "brief" or "return(s)"
+                description_lines = [ text ]
+                doxygen["returns" if command.startswith("return") else "brief"] = description_lines
+        elif description_lines != None:
+            text = line[doxygen_line_prefix_pattern.match(line).end():].rstrip()
+            if text:
+                description_lines.append(text) # continuation of the description
+            else:
+                description_lines = None # a blank line ends the description
+    if doxygen != None: # join each description's lines
+        for key in ("brief", "returns"):
+            if doxygen[key]:
+                doxygen[key] = ' '.join(doxygen[key]).strip()
+        for key in ("params", "tparams", "throws"):
+            for entry in doxygen[key]:
+                entry["description"] = ' '.join(entry["description"]).strip()
+    return content.strip(), "\n".join(usage_lines), doxygen
 
 def _format_location(location):
     if not location.file: # None
@@ -125,62 +411,60 @@ def _get_text_range(text_range): # get str from range [text_range.start, text_ra
     # row, col starts from 1
     start_row, start_col = range_start.line, range_start.column
     end_row, end_col = range_end.line, range_end.column
-    file_lines = [line for line in open(file_name)]
-    with open(file_name) as f:
-        lines = [ next(f) for x in range(end_row) ] # first end_row lines, each line ends with '\n'
-    # compose the string
-    # case 1: one line
-    if start_row == end_row:
-        row_res_str = lines[start_row - 1][start_col - 1: end_col - 1]
-        return ' '.join(row_res_str.split()).strip() # remove redundent whitespaces
-    # case 2: mulitiple lines, each line is guaranteed to ends with '\n' except for the last
-    assert start_row < end_row
-    row_res_str = lines[start_row - 1][start_col - 1:]
-    for i in range(start_row, end_row - 1): # [ start_row, end_row - 2 ] index
-        row_res_str += lines[i]
-    row_res_str += lines[end_row - 1][:end_col - 1]
-    return ' '.join(row_res_str.split()).strip() # remove redundent whitespaces
+    source_buffer = _get_source_buffer(file_name)
+    line_offsets = source_buffer["line_offsets"]
+    start_offset = line_offsets[start_row - 1] + start_col - 1
+    end_offset = line_offsets[end_row - 1] + end_col - 1
+    res_str = source_buffer["content"][start_offset:end_offset]
+    if not isinstance(res_str, str): # Python3: bytes
+        res_str = res_str.decode("utf-8", "replace")
+    return ' '.join(res_str.split()).strip() # remove redundent whitespaces
 
 def _is_transparent_decl(cursor):
     return (cursor.kind == cindex.CursorKind.ENUM_DECL) and (not cursor.is_scoped_enum())
 
-def _collect_hierarchy(cursor):
+def _collect_hierarchy(cursor, hierarchy_cache=None):
     if cursor.semantic_parent.kind == cindex.CursorKind.TRANSLATION_UNIT:
         return [], "(global)"
     # return tuple element #0
     # first: the highest level, last: immediate parent (the namespace/class/enum/..)
-    spelling_list = []     # each level's type spelling
-    transparency_list = [] # each level's transparency (e.g. non-scoped enum is transparent)
-    syntax_kind_list = []  # each level's syntax kind (e.g. namespace, class, enum)
-    location_list = []     # each level's source location string
-    temp_cursor = cursor
-    while True: # from child to parent, all the way up to the translation unit node
-        temp_cursor = temp_cursor.semantic_parent
-        if temp_cursor.kind == cindex.CursorKind.TRANSLATION_UNIT:
-            break
-        temp_cursor_spelling = _format_type_spelling(temp_cursor.spelling)
-        if not temp_cursor_spelling:
-            # anonymous, e.g. "typedef struct { ... } MyType_t;", then we use the type alias "MyType_t"
-            temp_cursor_spelling = _format_type_spelling(temp_cursor.type.spelling).split("::")[-1]
-        # insert to front, because we are going buttom-up
-        spelling_list.insert(0, temp_cursor_spelling)
-        transparency_list.insert(0, True if _is_transparent_decl(temp_cursor) else False)
-        syntax_kind_list.insert(0, _format_syntax_kind(temp_cursor.kind))
-        location_list.insert(0, _format_location(temp_cursor.location))
+    # a copy, so that the list cached for the immediate parent is not modified by the caller
+    hierarchy_dict_list = list(_get_scope_hierarchy(
+        cursor.semantic_parent, hierarchy_cache if hierarchy_cache != None else {}))
     # return tuple element #1
-    parent_kind_str = syntax_kind_list[-1] # the immediate parent
-    # build return list
-    hierarchy_dict_list = [ {
-        "spelling": spelling_list[i], # str
-        "transparent": transparency_list[i], # bool
-        "kind": syntax_kind_list[i],  # str
-        "location": location_list[i]  # str
-    } for i in range(len(spelling_list)) ]
+    parent_kind_str = hierarchy_dict_list[-1]["kind"] # the immediate parent
     return hierarchy_dict_list, parent_kind_str
 
+# the hierarchy of a scope (namespace/class/enum/..), including the scope itself as the last level;
+# computed once per scope, key: the scope's cursor, value: list of dict, shared by its members
+def _get_scope_hierarchy(scope_cursor, hierarchy_cache):
+    if scope_cursor.kind == cindex.CursorKind.TRANSLATION_UNIT:
+        return []
+    scope_hierarchy = hierarchy_cache.get(scope_cursor)
+    if scope_hierarchy != None:
+        return scope_hierarchy
+    scope_spelling = _format_type_spelling(scope_cursor.spelling)
+    if not scope_spelling:
+        # anonymous, e.g. "typedef struct { ... } MyType_t;", then we use the type alias "MyType_t"
+        scope_spelling = _format_type_spelling(scope_cursor.type.spelling).split("::")[-1]
+    # the parent's hierarchy plus one level, because we are going top-down
+    scope_hierarchy = _get_scope_hierarchy(scope_cursor.semantic_parent, hierarchy_cache) + [ {
+        "spelling": scope_spelling, # str
+        # each level's transparency (e.g. non-scoped enum is transparent)
+        "transparent": True if _is_transparent_decl(scope_cursor) else False, # bool
+        "kind": _format_syntax_kind(scope_cursor.kind), # str, e.g. namespace, class, enum
+        "location": _format_location(scope_cursor.location), # str
+    } ]
+    hierarchy_cache[scope_cursor] = scope_hierarchy
+    return scope_hierarchy
+
+_syntax_kind_names = {} # key: cindex.CursorKind, value: str, formatted once per kind
 def _format_syntax_kind(kind):
-    kind_str = str(kind).split(".")[-1].lower().replace("cxx_", "")
-    kind_str = kind_str.replace("_decl", "_declaration").replace("var_", "variable_")
+    kind_str = _syntax_kind_names.get(kind)
+    if kind_str == None:
+        kind_str = str(kind).split(".")[-1].lower().replace("cxx_", "")
+        kind_str = re.sub(r"_decl(?=_|$)", "_declaration", kind_str).replace("var_", "variable_")
+        _syntax_kind_names[kind] = kind_str
     return kind_str
 
 def _find_hierarchy_item_for_owning_template(hierarchy, template_level):
@@ -276,15 +560,7 @@ def _format_type_alias_chain(type_obj):
 def _get_default_expr(arg_expr): # return str or None
     return arg_expr.split('=')[-1].strip() if ('=' in arg_expr) else None
 
-no_return_funcs_CursorKindCursorKind = [ # no return type
-    cindex.CursorKind.CONSTRUCTOR,
-    cindex.CursorKind.DESTRUCTOR,
-]
-noexcept_ExceptionSpecificationKind = [
-    cindex.ExceptionSpecificationKind.DYNAMIC_NONE,   # throw(), not recommended since C++11
-    cindex.ExceptionSpecificationKind.BASIC_NOEXCEPT, # noexcept
-]
-def _format_func_proto(cursor, context_hierarchy=[]): # ordinary function/method templated function/method
+def _format_func_proto(cursor, context_hierarchy=[], type_cache=None): # ordinary function/method templated function/method
     # go through child elements, collecting ordinary args and possibly template params
     template_params_list = [] # list of tuple, e.g. [('typename', 'T', ''), ('void (*)()', 'F', ''), ('int', 'N', '0')]
     template_params_repr_list = [] # list of str, e.g. ['typename T', 'void (*F)()', 'int N = 0']
@@ -300,7 +576,7 @@ def _format_func_proto(cursor, context_hierarchy=[]): # ordinary function/method
             template_param_text = _format_arg_tuple_str_spelling(_get_text_range(c.extent).replace("class ", "typename "))
             template_params_repr_list.append(template_param_text)
             template_params_list.append({
-                "type": _collect_type_info(c.type, context_hierarchy, c), # tuple
+                "type": _collect_type_info(c.type, context_hierarchy, c, type_cache), # tuple
                 "arg_spelling": c.spelling, # str
                 "default_expr": _get_default_expr(template_param_text) # str or NoneType
             })
@@ -308,7 +584,7 @@ def _format_func_proto(cursor, context_hierarchy=[]): # ordinary function/method
             template_param_text = _format_arg_tuple_str_spelling(_get_text_range(c.extent))
             template_params_repr_list.append(template_param_text)
             template_params_list.append({
-                "type": _collect_type_info(c.type, context_hierarchy, c), # tuple
+                "type": _collect_type_info(c.type, context_hierarchy, c, type_cache), # tuple
                 "arg_spelling": c.spelling, # str
                 "default_expr": _get_default_expr(template_param_text) # str or NoneType
             })
@@ -317,7 +593,7 @@ def _format_func_proto(cursor, context_hierarchy=[]): # ordinary function/method
             args_text = _format_arg_tuple_str_spelling(_get_text_range(c.extent))
             args_repr_list.append(args_text)
             args_list.append({
-                "type": _collect_type_info(c.type, context_hierarchy, c), # tuple
+                "type": _collect_type_info(c.type, context_hierarchy, c, type_cache), # tuple
                 "arg_spelling": c.spelling, # str
                 "default_expr": _get_default_expr(args_text) # str or NoneType
             })
@@ -334,7 +610,7 @@ def _format_func_proto(cursor, context_hierarchy=[]): # ordinary function/method
     if cursor.kind in no_return_funcs_CursorKindCursorKind:
         return_type = None
     else:
-        return_type = _collect_type_info(cursor.result_type) # dict { spelling: str, type_info: dict }
+        return_type = _collect_type_info(cursor.result_type, type_cache=type_cache) # dict { spelling: str, type_info: dict }
     # 3. function name
     func_name = str(cursor.displayname).split('(')[0]
     # 4. for methods: cv-qualifier, "= 0", "final", "override"
@@ -388,7 +664,8 @@ def _format_func_proto(cursor, context_hierarchy=[]): # ordinary function/method
     )
 
 inheritance_access_specifiers = [ "public", "protected", "private" ]
-def _format_class_proto(cursor, context_hierarchy=[]):
+inheritance_keywords = inheritance_access_specifiers + [ "virtual" ]
+def _format_class_proto(cursor, context_hierarchy=[], type_cache=None, keyword_indexes=None):
     template_params_list = [] # list of tuple, e.g. [('int', 'N', ''), ('void (*)()', 'F', ''), ('typename', 'T', 'int')]
     template_params_repr_list = [] # list of str, e.g. ['int N', 'void (*F)()', 'typename T = int']
     base_list = []
@@ -398,7 +675,7 @@ def _format_class_proto(cursor, context_hierarchy=[]):
             template_param_text = _format_arg_tuple_str_spelling(_get_text_range(c.extent).replace("class ", "typename "))
             template_params_repr_list.append(template_param_text)
             template_params_list.append({
-                "type": _collect_type_info(c.type, context_hierarchy, c), # tuple
+                "type": _collect_type_info(c.type, context_hierarchy, c, type_cache), # tuple
                 "arg_spelling": c.spelling, # str
                 "default_expr": _get_default_expr(template_param_text) # str or NoneType
             })
@@ -406,7 +683,7 @@ def _format_class_proto(cursor, context_hierarchy=[]):
             template_param_text = _format_arg_tuple_str_spelling(_get_text_range(c.extent))
             template_params_repr_list.append(template_param_text)
             template_params_list.append({
-                "type": _collect_type_info(c.type, context_hierarchy, c), # tuple
+                "type": _collect_type_info(c.type, context_hierarchy, c, type_cache), # tuple
                 "arg_spelling": c.spelling, # str
                 "default_expr": _get_default_expr(template_param_text) # str or NoneType
             })
@@ -421,12 +698,11 @@ def _format_class_proto(cursor, context_hierarchy=[]):
             # defect in clang.cindex:
             #   no way to check inheritance access and virtual-ness from cindex.Cursor's method,
             #   so I have to go through the tokens
-            for t in c.get_tokens():
-                if t.kind == cindex.TokenKind.KEYWORD:
-                    if t.spelling in inheritance_access_specifiers:
-                        inheritance_access_specifier = t.spelling
-                    if t.spelling == "virtual":
-                        is_virtual_inheritance = True
+            for keyword in _find_keywords(c, inheritance_keywords, keyword_indexes):
+                if keyword in inheritance_access_specifiers:
+                    inheritance_access_specifier = keyword
+                if keyword == "virtual":
+                    is_virtual_inheritance = True
             base_def = c.get_definition() # cindex.Cursor object to the base class/template definition
             base_list.append({
                 "access": inheritance_access_specifier,        # str
@@ -452,14 +728,75 @@ def _format_class_proto(cursor, context_hierarchy=[]):
         base_list
     )
 
-def is_deleted_method(cursor):
+# tokenize the file once, return dict { offsets, spellings } of its keyword tokens, sorted by offset
+def _build_keyword_index(tu, source_file, file_size):
+    file_extent = cindex.SourceRange.from_locations(
+        cindex.SourceLocation.from_offset(tu, source_file, 0),
+        cindex.SourceLocation.from_offset(tu, source_file, file_size))
+    offsets, spellings = [], []
+    for t in tu.get_tokens(extent=file_extent):
+        if t.kind == cindex.TokenKind.KEYWORD:
+            offsets.append(t.location.offset)
+            spellings.append(t.spelling)
+    return {
+        "offsets": offsets,     # list of int, byte offset of each keyword token
+        "spellings": spellings, # list of str
+    }
+
+# return the keyword tokens within the cursor's extent that are in keywords (list of str), in order;
+# keyword_indexes is a dict (key: file name, value: dict) shared by cursors of the same TU:
+# a cursor is tokenized only if one of the keywords appears in its text (e.g. not for most methods
+# when looking for "delete"), and once the tokenized cursors add up to the file's size, the
+# file is tokenized as a whole, to be shared by the cursors in it thereafter
+def _find_keywords(cursor, keywords, keyword_indexes=None):
+    extent = cursor.extent
+    range_start, range_end = extent.start, extent.end
+    file_name = str(range_start.file) if range_start.file else None
+    keyword_index = None
+    if keyword_indexes != None and file_name != None and file_name == str(range_end.file):
+        start_offset, end_offset = range_start.offset, range_end.offset
+        content = _get_source_buffer(file_name)["content"]
+        text = content[start_offset:end_offset]
+        if not any(_to_bytes(keyword) in text for keyword in keywords):
+            return []
+        keyword_index = keyword_indexes.setdefault(file_name, { "tokenized_size": 0 })
+        if "offsets" not in keyword_index:
+            keyword_index["tokenized_size"] += len(text)
+            if keyword_index["tokenized_size"] < len(content):
+                keyword_index = None # cheaper to tokenize the cursor alone, so far
+            else:
+                keyword_index.update(_build_keyword_index(cursor.translation_unit, range_start.file, len(content)))
+    if keyword_index == None:
+        return [ t.spelling for t in cursor.get_tokens()
+                 if t.kind == cindex.TokenKind.KEYWORD and t.spelling in keywords ]
+    # the tokens starting in [start, end), as cursor.get_tokens() would give
+    first = bisect.bisect_left(keyword_index["offsets"], start_offset)
+    last = bisect.bisect_left(keyword_index["offsets"], end_offset)
+    return [ keyword for keyword in keyword_index["spellings"][first:last] if keyword in keywords ]
+
+# the beginning of a function body: "{", a constructor's initializer list, or a function-try-block, after
+# whitespace and comments; a block comment ends at the first "*/"
+function_body_start_pattern = re.compile(br"(?:\s|/\*(?:[^*]|\*(?!/))*\*/|//[^\n]*)*(?:\{|:|try\b)")
+
+# function bodies are skipped in parsing, so libclang does not report a function defined with a body as a
+# definition; its extent ends before the body, so look at the source text right after the extent
+def _has_function_body(cursor):
+    if cursor.kind not in func_like_CursorKind:
+        return False
+    range_end = cursor.extent.end
+    if range_end.file == None or str(range_end.file) != str(cursor.location.file):
+        return False # e.g. declared by a macro
+    source_buffer = _get_source_buffer(str(range_end.file))
+    line_offsets = source_buffer["line_offsets"]
+    if range_end.line > len(line_offsets):
+        return False
+    offset = line_offsets[range_end.line - 1] + range_end.column - 1
+    return function_body_start_pattern.match(source_buffer["content"], offset) != None
+
+def is_deleted_method(cursor, keyword_indexes=None):
     # defect in clang.cindex: no way to check method being marked by "=delete" from
     # cindex.Cursor's method, so I have to go through the tokens
-    for t in cursor.get_tokens():
-        if (t.kind == cindex.TokenKind.KEYWORD
-            and t.spelling == "delete"):
-            return True
-    return False
+    return bool(_find_keywords(cursor, [ "delete" ], keyword_indexes))
 
 def _format_sizeof_type(type_obj):
     sizeof_type_raw = type_obj.get_size()
@@ -469,58 +806,47 @@ def _format_sizeof_type(type_obj):
 """
 Index visiting
 """
-func_like_CursorKind = [ # function-like
-    cindex.CursorKind.FUNCTION_DECL,
-    cindex.CursorKind.FUNCTION_TEMPLATE,
-    cindex.CursorKind.CONVERSION_FUNCTION,
-    cindex.CursorKind.CONSTRUCTOR,
-    cindex.CursorKind.DESTRUCTOR,
-    cindex.CursorKind.CXX_METHOD,
-]
+# identical types share one dict { spelling, type_info }, built once per translation unit
+def _collect_type_info(c_type, context_hierarchy=[], c=None, type_cache=None):
+    if type_cache == None:
+        return _build_type_info(c_type, context_hierarchy, c, type_cache)
+    type_key = _get_type_cache_key(c_type, context_hierarchy, c)
+    type_info = type_cache.get(type_key)
+    if type_info == None:
+        type_info = type_cache[type_key] = _build_type_info(c_type, context_hierarchy, c, type_cache)
+    return type_info
 
-method_like_CursorKind = [ # method-like
-    cindex.CursorKind.CXX_METHOD,
-    cindex.CursorKind.CONVERSION_FUNCTION, # only valid for class, e.g. MyClass::operator int();
-    cindex.CursorKind.CONSTRUCTOR,
-    cindex.CursorKind.DESTRUCTOR,
-    # FUNCTION_TEMPLATE -- needs to check semantic_parent
-]
-
-class_like_CursorKind = [ # class-like
-    cindex.CursorKind.CLASS_DECL,
-    cindex.CursorKind.STRUCT_DECL,
-    cindex.CursorKind.CLASS_TEMPLATE,
-]
-
-val_like_CursorKind = [ # value-like
-    cindex.CursorKind.VAR_DECL,
-    cindex.CursorKind.FIELD_DECL,
-    cindex.CursorKind.ENUM_CONSTANT_DECL,
-]
-
-array_TypeKind = [
-    # 1) int arr[5]; int arr[] = {..}; int arr[expr] where expr is an Integral Constant Expression
-    cindex.TypeKind.CONSTANTARRAY,
-    # 2) int arr[], as a function formal arg
-    cindex.TypeKind.INCOMPLETEARRAY,
-    # 3) int arr[expr]; where expr is not an Integral Constant Expression
-    cindex.TypeKind.VARIABLEARRAY,
-    # 4) size unknown until template instantiation, then it becomes either 1) or 3)
-    cindex.TypeKind.DEPENDENTSIZEDARRAY,
-]
-
-pointer_TypeKind = [
-    cindex.TypeKind.POINTER,       # 1) int *p = &n; Class *p = &objClass; int (*p)(int) = &func;
-    cindex.TypeKind.MEMBERPOINTER, # 2) int Class::* p = &Class::member; int (Class::* p)(int) = &Class::method;
-]
+def _get_type_cache_key(c_type, context_hierarchy, c):
+    type_kind = c_type.kind
+    canonical_spelling = c_type.get_canonical().spelling
+    type_key = (type_kind, c_type.spelling, canonical_spelling)
+    if type_kind in alias_or_compound_TypeKind:
+        # type aliases with the same spelling and canonical type may be declared at different places
+        # (and so are their type alias chains), even behind pointer or array types
+        declared_type = c_type
+        while True:
+            if declared_type.kind in pointer_TypeKind:
+                declared_type = declared_type.get_pointee()
+            elif declared_type.kind in array_TypeKind:
+                declared_type = declared_type.get_array_element_type()
+            else:
+                break
+        type_key += (_format_location(declared_type.get_declaration().location),)
+    if "type-parameter-" in canonical_spelling:
+        # a type param is resolved against the enclosing templates, see _format_type_param_decl_location()
+        type_key += (
+            tuple((item["spelling"], item["location"]) for item in context_hierarchy if "template" in item["kind"]),
+            _format_location(c.semantic_parent.location) if c else None,
+        )
+    return type_key
 
 # C++ has a very complicated type system
 # this function is potentially called recursively
-def _collect_type_info(c_type, context_hierarchy=[], c=None): # return a tuple (spelling str, dict)
+def _build_type_info(c_type, context_hierarchy, c, type_cache): # return a tuple (spelling str, dict)
     type_kind = c_type.kind
     type_spelling = _format_type(c_type)
     sizeof_type = _format_sizeof_type(c_type) # int or NoneType (e.g. type param)
-    if type_kind in [ cindex.TypeKind.TYPEDEF, cindex.TypeKind.ELABORATED ]:
+    if type_kind in alias_TypeKind:
         # if the canonical type (real type under all the layers of typedef) is not a type param, then it is the same
         # as type_alias_chain[-1].spelling, i.e. completely resoluted;
         # if it is a type param, then it is "(type_parameter)"
@@ -544,7 +870,7 @@ def _collect_type_info(c_type, context_hierarchy=[], c=None): # return a tuple (
                 "type_alias_chain": _format_type_alias_chain(c_type), # str or NoneType
                 # real type under all the layers of typedef
                 "canonical_type": _collect_type_info(
-                    canonical_type, context_hierarchy, c), # tuple of (str, dict)
+                    canonical_type, context_hierarchy, c, type_cache), # tuple of (str, dict)
             }
         ) # tuple of (str, dict)
     elif type_kind == cindex.TypeKind.UNEXPOSED:
@@ -588,7 +914,7 @@ def _collect_type_info(c_type, context_hierarchy=[], c=None): # return a tuple (
                 "array_size": array_size if array_size > 0 else None,
                 # tuple of (str, dict)
                 "array_element_type": _collect_type_info(
-                    c_type.get_array_element_type(), context_hierarchy, c),
+                    c_type.get_array_element_type(), context_hierarchy, c, type_cache),
             }
         ) # tuple of (str, dict)
     elif type_kind in pointer_TypeKind:
@@ -601,7 +927,7 @@ def _collect_type_info(c_type, context_hierarchy=[], c=None): # return a tuple (
                 "is_pointer": True,     # bool
                 "is_function": False,   # bool
                 # tuple of (str, dict)
-                "pointee_type": _collect_type_info(c_type.get_pointee(), context_hierarchy, c),
+                "pointee_type": _collect_type_info(c_type.get_pointee(), context_hierarchy, c, type_cache),
             }
         ) # tuple of (str, dict)
     else:
@@ -617,25 +943,44 @@ def _collect_type_info(c_type, context_hierarchy=[], c=None): # return a tuple (
         ) # tuple of (str, dict)
     return { "spelling": res[0], "type_info": res[1] } # dict { spelling, type_info }
 
-# visit an AST node (pointed by cursor), returning a symbol dict
-def _visit_cursor(c, macro_instant_locs_name_map):
-    symbol = {} # dict for this symbol
-    # part 1. mandated fields
+# the fields of a symbol dict are filled in groups, each by a _visit_*_fields(c, symbol, visit_context)
+# function; visit_context is a dict shared by all cursors of the TU, see _new_visit_context()
+
+def _visit_spelling_fields(c, symbol, visit_context):
     symbol["spelling"] = "%s" % c.spelling # str
-    hierarchy_info = _collect_hierarchy(c)
+
+def _visit_hierarchy_fields(c, symbol, visit_context):
+    hierarchy_info = _collect_hierarchy(c, visit_context["hierarchy_cache"])
     symbol["hierarchy"] = hierarchy_info[0] # list of dict, might be empty, top-down
     symbol["parent_kind"] = hierarchy_info[1] # str
+
+def _visit_location_fields(c, symbol, visit_context):
     symbol["location"] = _format_location(c.location) # str
+
+def _visit_kind_fields(c, symbol, visit_context):
     symbol["kind"] = _format_syntax_kind(c.kind) # str
+
+def _visit_usr_fields(c, symbol, visit_context):
+    symbol["usr"] = c.get_usr() # str, the same for all declarations of an entity, in any file; may be empty
+    symbol["is_definition"] = c.is_definition() or _has_function_body(c) # bool
+
+def _visit_comment_fields(c, symbol, visit_context):
+    if visit_context["skip_comments"]:
+        symbol["comment"], symbol["usage"] = "", "" # not even fetched from libclang
+        return
     comment_tuple = _format_comment(c.raw_comment)
     symbol["comment"] = comment_tuple[0] # str
     symbol["usage"] = comment_tuple[1] # str
-    c_type = c.type
-    # part 2. optional fields
+    if comment_tuple[2] != None:
+        symbol["doxygen"] = comment_tuple[2] # dict
+
+def _visit_proto_fields(c, symbol, visit_context):
+    type_cache = visit_context["type_cache"]
     if c.kind in func_like_CursorKind:
-        func_proto_tuple = _format_func_proto(c, symbol["hierarchy"])
+        func_proto_tuple = _format_func_proto(c, symbol["hierarchy"], type_cache)
         # check if this function declaration is instantiated by a macro
-        symbol["from_macro"] = macro_instant_locs_name_map.get(symbol["location"]) # str, if not found, then None
+        # str, if not found, then None
+        symbol["from_macro"] = visit_context["macro_instant_locs_name_map"].get(symbol["location"])
         if symbol["from_macro"]:
             symbol["declaration_pretty"] = symbol["declaration"] = _get_text_range(c.extent) # str
         else:
@@ -668,7 +1013,7 @@ def _visit_cursor(c, macro_instant_locs_name_map):
         else: # False
             symbol["no_throw_guarantee"] = "not_guaranteed"
     elif c.kind in class_like_CursorKind:
-        class_proto_tuple = _format_class_proto(c, symbol["hierarchy"])
+        class_proto_tuple = _format_class_proto(c, symbol["hierarchy"], type_cache, visit_context["keyword_indexes"])
         symbol["declaration"] = "%s;" % class_proto_tuple[0][0] # str
         symbol["declaration_pretty"] = "%s;" % class_proto_tuple[0][1] # str
         symbol["is_template"] = True if class_proto_tuple[1] else False # bool
@@ -678,20 +1023,28 @@ def _visit_cursor(c, macro_instant_locs_name_map):
         symbol["base_clause"] = class_proto_tuple[3] # list of dict
         symbol["is_abstract"] = c.is_abstract_record() # bool
         # int or NoneType (e.g. type param) # int or NoneType (e.g. type param)
-        symbol["size"] = _format_sizeof_type(c_type)
+        symbol["size"] = _format_sizeof_type(c.type)
+
+def _visit_member_fields(c, symbol, visit_context):
     if c.semantic_parent.kind in class_like_CursorKind:
         symbol["access"] = str(c.access_specifier).split('.')[-1].lower() # str
         symbol["is_member"] = True # boolean
     else:
         symbol["is_member"] = False # boolean
-    if c.kind in val_like_CursorKind + [ cindex.CursorKind.CLASS_DECL, cindex.CursorKind.STRUCT_DECL ]:
+
+def _visit_type_fields(c, symbol, visit_context):
+    if c.kind in sized_CursorKind:
+        c_type = c.type
         symbol["POD"] = c_type.is_pod() # bool (POD: Plain Old Data)
         # C++ has a very complicated type system
         # dict { spelling, type_info }
-        symbol["type"] = _collect_type_info(c_type, symbol["hierarchy"], c)
+        symbol["type"] = _collect_type_info(c_type, symbol["hierarchy"], c, visit_context["type_cache"])
         # int or NoneType (e.g. type param) # int or NoneType (e.g. type param)
         symbol["size"] = symbol["type"]["type_info"]["type_size"]
-    if c.kind in [ cindex.CursorKind.TYPEDEF_DECL, cindex.CursorKind.TYPE_ALIAS_DECL ]:
+
+def _visit_type_alias_fields(c, symbol, visit_context):
+    if c.kind in type_alias_CursorKind:
+        c_type = c.type
         # e.g. "typedef float Float;", "using Float = float;"
         # str, one-step resoluted
         symbol["type_alias_underlying_type"] = _format_type(c.underlying_typedef_type)
@@ -699,9 +1052,11 @@ def _visit_cursor(c, macro_instant_locs_name_map):
         symbol["type_alias_chain"] = _format_type_alias_chain(c_type)
         # str, completely resoluted
         symbol["canonical_type"] = _format_type(c_type.get_canonical())
+
+def _visit_method_fields(c, symbol, visit_context):
     if (c.kind in method_like_CursorKind
         or (c.kind == cindex.CursorKind.FUNCTION_TEMPLATE and c.semantic_parent.kind in class_like_CursorKind)):
-        symbol["is_deleted"] = is_deleted_method(c) # bool
+        symbol["is_deleted"] = is_deleted_method(c, visit_context["keyword_indexes"]) # bool
         method_property = []
         if c.is_static_method():
             method_property.append("static")
@@ -733,7 +1088,7 @@ def _visit_cursor(c, macro_instant_locs_name_map):
         destructor_property = []
         # destructor cannot be 'static' or 'const'
         if symbol["is_deleted"]: # marked by "= delete"
-            constructor_property.append("delete")
+            destructor_property.append("delete")
         if c.is_default_method(): # marked by "= default"
             destructor_property.append("default")
         if c.is_virtual_method():
@@ -741,72 +1096,1093 @@ def _visit_cursor(c, macro_instant_locs_name_map):
         if c.is_pure_virtual_method():
             destructor_property.append("pure_virtual")
         symbol["destructor_property"] = destructor_property # list
+
+def _visit_static_member_fields(c, symbol, visit_context):
     if (c.semantic_parent.kind in class_like_CursorKind
         and c.kind == cindex.CursorKind.VAR_DECL):
         # static member is of VAR_DECL kind instead of FIELD_DECL kind
         symbol["static_member"] = True # bool
     if c.kind == cindex.CursorKind.FIELD_DECL:
         symbol["static_member"] = False # bool
+
+def _visit_extra_kind_fields(c, symbol, visit_context):
+    visit_function = extra_kind_handlers.get(c.kind)
+    if visit_function != None: # e.g. None for a built-in kind asked by LazySymbol for an unknown field
+        visit_function(c, symbol, visit_context)
+
+def _visit_enum_fields(c, symbol, visit_context):
     if c.kind == cindex.CursorKind.ENUM_DECL:
         symbol["scoped_enum"] = True if c.is_scoped_enum() else False
         symbol["enum_underlying_type"] = _collect_type_info(
-            c.enum_type, symbol["hierarchy"], c)
+            c.enum_type, symbol["hierarchy"], c, visit_context["type_cache"])
     if c.kind == cindex.CursorKind.ENUM_CONSTANT_DECL:
         symbol["enum_underlying_type"] = _collect_type_info(
-            c_type.get_declaration().enum_type, symbol["hierarchy"], c)
+            c.type.get_declaration().enum_type, symbol["hierarchy"], c, visit_context["type_cache"])
         symbol["enum_value"] = c.enum_value
-    return symbol
+
+# field groups in the order they are visited, each being a tuple
+# (name, visiting function name, fields it may fill, groups whose fields it reads);
+# "size" is filled by both "proto" and "type" (for class and struct), the latter prevails
+symbol_field_groups = [
+    ("spelling",      "_visit_spelling_fields",      [ "spelling" ], []),
+    ("hierarchy",     "_visit_hierarchy_fields",     [ "hierarchy", "parent_kind" ], []),
+    ("location",      "_visit_location_fields",      [ "location" ], []),
+    ("kind",          "_visit_kind_fields",          [ "kind" ], []),
+    ("usr",           "_visit_usr_fields",           [ "usr", "is_definition" ], []),
+    ("comment",       "_visit_comment_fields",       [ "comment", "usage", "doxygen" ], []),
+    ("proto",         "_visit_proto_fields",         [ "from_macro", "declaration", "declaration_pretty",
+                                                       "is_template", "template_args_list", "args_list",
+                                                       "return_type", "specifier", "no_throw_guarantee",
+                                                       "base_clause", "is_abstract", "size" ],
+                                                     [ "hierarchy", "location" ]),
+    ("member",        "_visit_member_fields",        [ "access", "is_member" ], []),
+    ("type",          "_visit_type_fields",          [ "POD", "type", "size" ], [ "hierarchy", "proto" ]),
+    ("type_alias",    "_visit_type_alias_fields",    [ "type_alias_underlying_type", "type_alias_chain",
+                                                       "canonical_type" ], []),
+    ("method",        "_visit_method_fields",        [ "is_deleted", "method_property",
+                                                       "constructor_property", "destructor_property" ], []),
+    ("static_member", "_visit_static_member_fields", [ "static_member" ], []),
+    ("enum",          "_visit_enum_fields",          [ "scoped_enum", "enum_underlying_type", "enum_value" ],
+                                                     [ "hierarchy" ]),
+    ("extra",         "_visit_extra_kind_fields",    [], [ "hierarchy", "location" ]), # see register_kind_handler()
+]
+symbol_field_group_map = dict((group[0], group) for group in symbol_field_groups)
+symbol_fields = [] # list of str, all fields in visiting order, and "id"
+for group in symbol_field_groups:
+    symbol_fields += [ field for field in group[2] if field not in symbol_fields ]
+symbol_fields.append("id")
+
+# run the field group, after the groups it depends on (if not yet run); done_groups is a set of group names
+def _visit_field_group(group_name, c, symbol, visit_context, done_groups):
+    if group_name in done_groups:
+        return
+    done_groups.add(group_name)
+    group = symbol_field_group_map[group_name]
+    for required_group_name in group[3]:
+        _visit_field_group(required_group_name, c, symbol, visit_context, done_groups)
+    globals()[group[1]](c, symbol, visit_context) # looked up by name, so that it can be profiled
+
+# return the names of the field groups needed to fill the fields (list of str), in visiting order
+def _get_field_groups(fields):
+    fields_key = tuple(fields)
+    field_groups = _field_groups_cache.get(fields_key)
+    if field_groups == None:
+        field_groups = [ group[0] for group in symbol_field_groups if set(group[2]) & set(fields) ]
+        _field_groups_cache[fields_key] = field_groups
+    return field_groups
+_field_groups_cache = {} # key: tuple of fields, value: list of group names
+
+# key: cindex.CursorKind, value: function (c, symbol, visit_context) filling the kind's own fields of the
+# symbol dict, or None; see register_kind_handler()
+extra_kind_handlers = collections.OrderedDict()
+
+# the dispatch table, key: cindex.CursorKind of the symbols indexed, value: tuple of the groups visiting
+# the kind, in visiting order; nodes of other kinds are skipped; built when first used after libclang is
+# loaded, and again after a handler is registered
+_kind_field_groups = {}
+
+def _get_kind_field_groups():
+    if not _kind_field_groups:
+        group_kinds = dict(field_group_CursorKinds, extra=frozenset(
+            kind for kind, visit_function in extra_kind_handlers.items() if visit_function != None))
+        for kind in interested_CursorKinds | frozenset(extra_kind_handlers):
+            _kind_field_groups[kind] = tuple(group for group in symbol_field_groups
+                                             if group[0] not in group_kinds or kind in group_kinds[group[0]])
+    return _kind_field_groups
+
+# exposed as library interface, to index the symbols of a kind (a cindex.CursorKind, e.g. USING_DECLARATION
+# or FRIEND_DECL) besides the built-in ones; visit_function(c, symbol, visit_context), if given, fills the
+# kind's own fields of the symbol dict, after the fields common to all kinds (e.g. spelling, hierarchy,
+# location, kind, comment), or, for a built-in kind, after its other fields; fields= (see get()) keeps
+# the built-in fields only; register it in each process indexing files, before indexing them
+def register_kind_handler(cursor_kind, visit_function=None):
+    extra_kind_handlers[cursor_kind] = visit_function
+    _kind_field_groups.clear()
+
+def _new_visit_context(skip_comments=False):
+    return {
+        "skip_comments": skip_comments, # bool, if True, "comment" and "usage" are left empty
+        "macro_instant_locs_name_map": {}, # dict, key: location str, value: macro name
+        "hierarchy_cache": {}, # dict, key: cursor of a scope, value: the scope's hierarchy list
+        "type_cache": {},      # dict, key: see _get_type_cache_key(), value: dict { spelling, type_info }
+        "keyword_indexes": {}, # dict, key: file name, value: see _find_keywords()
+    }
+
+# a read-only mapping of a symbol's fields, like a symbol dict, but each field is filled when it is first
+# accessed (along with the other fields in its group); it holds the cursor, and thus the TU, so it is
+# only valid as long as the source files are not changed
+class LazySymbol(Mapping):
+    __slots__ = [ "_cursor", "_visit_context", "_symbol", "_done_groups" ]
+
+    def __init__(self, cursor, visit_context, symbol_id, file_name=None):
+        self._cursor = cursor
+        self._visit_context = visit_context
+        self._symbol = { "id": symbol_id } # dict, the fields filled so far
+        if file_name != None: # see _traverse_ast()
+            self._symbol["file"] = file_name
+        self._done_groups = set()
+
+    def __getitem__(self, field):
+        # run all groups that may fill the field, even if it is filled, e.g. "size" by "proto" but not yet "type";
+        # a field that no built-in group fills may be filled by an extra kind handler
+        for group_name in _get_field_groups([ field ]) or [ "extra" ]:
+            _visit_field_group(group_name, self._cursor, self._symbol, self._visit_context, self._done_groups)
+        return self._symbol[field] # KeyError if the field is not present for this kind of symbol
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __repr__(self):
+        return "LazySymbol(%s)" % self._symbol["id"]
+
+    def to_dict(self): # fill all fields, return a symbol dict
+        for group in _get_kind_field_groups()[self._cursor.kind]:
+            _visit_field_group(group[0], self._cursor, self._symbol, self._visit_context, self._done_groups)
+        return dict(self._symbol)
+
+# visit an AST node (pointed by cursor) of a kind indexed, returning a symbol dict; only the field groups
+# visiting its kind are run; if fields (list of str) is given, only those fields are filled
+def _visit_cursor(c, visit_context, fields=None):
+    symbol = {} # dict for this symbol
+    kind_field_groups = _get_kind_field_groups()[c.kind]
+    if fields == None:
+        # part 1. mandated fields, then part 2. optional fields
+        module_globals = globals() # functions looked up by name, so that they can be profiled
+        for group in kind_field_groups:
+            module_globals[group[1]](c, symbol, visit_context)
+        return symbol
+    done_groups = set()
+    for group_name in _get_field_groups(fields):
+        if symbol_field_group_map[group_name] in kind_field_groups:
+            _visit_field_group(group_name, c, symbol, visit_context, done_groups)
+    return dict((field, value) for field, value in symbol.items() if field in fields)
 
 """
 AST traversing
 """
 
-def _traverse_ast(root_node, target_filename, user_include_paths, print_out):
-    macro_instant_locs_name_map = {} # dict, key: location str, value: macro name
-    symbols = [] # list of symbol dicts
+# walk the AST in the same order as root_node.walk_preorder(), but without entering top-level
+# nodes that lie wholly in other files, e.g. the thousands of declarations from <vector>;
+# top-level macro instantiations are always yielded, as they have no children;
+# if top_level_range (tuple (start, end)) is given, only the top-level nodes in [start, end) are walked,
+# after the top-level macro instantiations before start (not counted), which the nodes may expand from;
+# if is_indexed_file (function, file name -> bool) is given, nodes in the files it accepts are entered too
+def _walk_pruned_ast(root_node, target_filename, traversal_stats, top_level_range=None, is_indexed_file=None):
+    for top_level_index, top_level_node in enumerate(root_node.get_children()):
+        if top_level_range and top_level_index < top_level_range[0]:
+            if top_level_node.kind == cindex.CursorKind.MACRO_INSTANTIATION:
+                yield top_level_node
+            continue
+        if top_level_range and top_level_index >= top_level_range[1]:
+            return
+        if top_level_node.kind != cindex.CursorKind.MACRO_INSTANTIATION:
+            extent = top_level_node.extent
+            start_filename, end_filename = str(extent.start.file), str(extent.end.file)
+            if (start_filename != target_filename and end_filename != target_filename
+                and not (is_indexed_file and (is_indexed_file(start_filename) or is_indexed_file(end_filename)))):
+                traversal_stats["skipped"] += 1
+                continue # skip the whole subtree
+        for c in top_level_node.walk_preorder():
+            traversal_stats["visited"] += 1
+            yield c
+
+# return a function (file name -> bool) telling if a header's symbols are indexed along with the target
+# file's: those in the user include paths, except the ones header_owners (dict, key: file name, value: the
+# target file through which it is indexed, see IncludeGraph.get_header_owners()) assigns to other files
+def _make_header_filter(target_filename, user_include_paths, header_owners=None):
+    target_filename = os.path.abspath(target_filename)
+    def is_indexed_header(filename):
+        return (_is_in_paths(filename, user_include_paths)
+                and (header_owners or {}).get(os.path.abspath(filename), target_filename) == target_filename)
+    return is_indexed_header
+
+# yields symbol dicts one at a time, in the order of AST preorder traversal
+# if fields (list of str) is given, only those fields (and "id") are filled; if lazy is True,
+# yields LazySymbol objects instead; top_level_range: see _walk_pruned_ast();
+# if is_indexed_header (see _make_header_filter()) is given, the symbols in the headers it accepts are
+# yielded too, each symbol having "file", the file it is in (normalized, if a header), and an id numbered
+# in that file; they are grouped by file, the target file's first (yielded as visited), then the headers'
+# in the order their first symbols are visited (yielded at the end)
+def _traverse_ast(root_node, target_filename, user_include_paths, traversal_stats=None, fields=None, lazy=False,
+                  skip_comments=False, top_level_range=None, is_indexed_header=None):
+    visit_context = _new_visit_context(skip_comments)
+    macro_instant_locs_name_map = visit_context["macro_instant_locs_name_map"]
+    is_in_user_paths_map = {} # dict, key: file name, value: bool
     count = 0
-    for c in root_node.walk_preorder(): # walk the AST (c: the cursor to an AST node)
+    indexed_file_map = { target_filename: True } # dict, key: file name, value: bool, if its symbols are yielded
+    def is_indexed_file(filename):
+        if filename not in indexed_file_map:
+            indexed_file_map[filename] = is_indexed_header(filename)
+        return indexed_file_map[filename]
+    file_symbols = collections.OrderedDict() # key: header file name, value: list of its symbols
+    file_counts = {} # dict, key: file name, value: number of symbols in it so far
+    if traversal_stats == None:
+        traversal_stats = {}
+    traversal_stats.update({ "visited": 0, "skipped": 0 })
+    kind_field_groups = _get_kind_field_groups() # the kinds indexed
+    for c in _walk_pruned_ast(root_node, target_filename, traversal_stats, top_level_range,
+                              is_indexed_file if is_indexed_header else None): # c: the cursor to an AST node
+        c_kind = c.kind
         c_filename = str(c.location.file)
         is_in_target_file = (c_filename == target_filename)
-        if (c.kind == cindex.CursorKind.MACRO_INSTANTIATION
-            and (is_in_target_file or _is_in_paths(c_filename, user_include_paths))):
+        if (c_kind == cindex.CursorKind.MACRO_INSTANTIATION and not is_in_target_file
+            and c_filename not in is_in_user_paths_map):
+            is_in_user_paths_map[c_filename] = _is_in_paths(c_filename, user_include_paths)
+        if (c_kind == cindex.CursorKind.MACRO_INSTANTIATION
+            and (is_in_target_file or is_in_user_paths_map[c_filename])):
             # collect macro instantiation information in the target file or in user include files
             # defect in clang.cindex: we cannot fetch the macro definition for this
             # macro; also note that macro definitions at different places could have
             # the same name
             macro_instant_locs_name_map[_format_location(c.location)] = c.spelling
-        if c_filename != target_filename:
+        if c_filename != target_filename and not (is_indexed_header and is_indexed_file(c_filename)):
             continue # skip header files
-        if c.kind not in interested_CursorKinds:
+        if c_kind not in kind_field_groups:
             continue # skip uninterested node
-        if not c.spelling:
-            continue # skip anonymous node, e.g. anonymous struct declaration
+        if not c.spelling and c_kind in interested_CursorKinds:
+            continue # skip anonymous node, e.g. anonymous struct declaration; nodes of extra kinds are kept
         # visit this node entity, get a dict
-        symbol = _visit_cursor(c, macro_instant_locs_name_map)
+        if is_indexed_header:
+            # a header reached by different paths (e.g. "./s.h", "inc/../s.h") is one file
+            file_name = c_filename if c_filename == target_filename else os.path.normpath(c_filename)
+            count = file_counts[file_name] = file_counts.get(file_name, 0) + 1
+            symbol_id = "%s#%d" % (file_name, count)
+            if lazy:
+                symbol = LazySymbol(c, visit_context, symbol_id, file_name)
+            else:
+                symbol = _visit_cursor(c, visit_context, fields)
+                symbol["id"] = symbol_id
+                symbol["file"] = file_name
+            if file_name == target_filename:
+                yield symbol # the target file's group is the first, no need to wait
+            else:
+                file_symbols.setdefault(file_name, []).append(symbol)
+            continue
         count += 1
-        symbol["id"] = "%s#%d" % (target_filename, count)
-        # collect to symbols list
-        symbols.append(symbol)
-        # print to stdout
-        if symbol and print_out:
-            _print_to_stdout(symbol)
-    return symbols # list of symbol dicts
+        symbol_id = "%s#%d" % (target_filename, count)
+        if lazy:
+            yield LazySymbol(c, visit_context, symbol_id)
+            continue
+        symbol = _visit_cursor(c, visit_context, fields)
+        symbol["id"] = symbol_id
+        yield symbol
+    for symbols in file_symbols.values(): # only if is_indexed_header
+        for symbol in symbols:
+            yield symbol
+
+# split the top-level nodes into at most chunk_count ranges (list of tuple (start, end)), in source order,
+# each having about the same number of lines in the target file; nodes in other files weigh nothing
+def _split_top_level_nodes(root_node, target_filename, chunk_count):
+    weights = [] # list of int, of each top-level node
+    for top_level_node in root_node.get_children():
+        extent = top_level_node.extent
+        if (top_level_node.kind == cindex.CursorKind.MACRO_INSTANTIATION
+            or (str(extent.start.file) != target_filename and str(extent.end.file) != target_filename)):
+            weights.append(0)
+        else:
+            weights.append(extent.end.line - extent.start.line + 1)
+    total_weight = sum(weights)
+    ranges = []
+    start, weight_so_far = 0, 0
+    for top_level_index, weight in enumerate(weights):
+        weight_so_far += weight
+        if weight_so_far * chunk_count >= total_weight * (len(ranges) + 1) and weight_so_far < total_weight:
+            ranges.append((start, top_level_index + 1))
+            start = top_level_index + 1
+    ranges.append((start, len(weights)))
+    return ranges
+
+_traversal_worker_context = None # dict, in a worker process of parallel traversal
+def _init_traversal_worker(target_filename, parse_args, parse_options, user_include_paths, fields, skip_comments):
+    global _traversal_worker_context
+    _load_libclang() # not inherited if the worker process is spawned instead of forked
+    index = cindex.Index.create()
+    _traversal_worker_context = {
+        "index": index, # cindex.Index, kept alive as long as the TU
+        "tu": index.parse(target_filename, args=parse_args, options=parse_options),
+        "target_filename": target_filename,
+        "user_include_paths": user_include_paths,
+        "fields": fields,
+        "skip_comments": skip_comments,
+    }
+
+# return tuple (list of symbol dicts, traversal stats dict) of the top-level nodes in the range
+def _run_traversal_chunk(top_level_range):
+    context = _traversal_worker_context
+    traversal_stats = {}
+    symbols = list(_traverse_ast(context["tu"].cursor, context["target_filename"], context["user_include_paths"],
+                                 traversal_stats, context["fields"], False, context["skip_comments"],
+                                 top_level_range))
+    return symbols, traversal_stats
+
+# the same as _traverse_ast() (not lazy), but chunks of the top-level nodes are traversed by jobs worker
+# processes, each parsing the file once with the same args (with the PCH, if any), as a TU cannot be
+# shared between processes (one saved and loaded reports absolute file names instead of those parsed);
+# symbols are yielded in source order as chunks are done, with ids numbered across chunks
+def _traverse_ast_parallel(tu, parse_args, parse_options, target_filename, user_include_paths, traversal_stats,
+                           fields, skip_comments, jobs):
+    import multiprocessing
+    top_level_ranges = _split_top_level_nodes(tu.cursor, target_filename, jobs * TRAVERSE_CHUNKS_PER_JOB)
+    if len(top_level_ranges) == 1:
+        for symbol in _traverse_ast(tu.cursor, target_filename, user_include_paths, traversal_stats,
+                                    fields, False, skip_comments):
+            yield symbol
+        return
+    traversal_stats.update({ "visited": 0, "skipped": 0 })
+    count = 0
+    pool = multiprocessing.Pool(processes=min(jobs, len(top_level_ranges)), initializer=_init_traversal_worker,
+                                initargs=(target_filename, parse_args, parse_options, user_include_paths,
+                                          fields, skip_comments))
+    try:
+        for chunk_symbols, chunk_stats in pool.imap(_run_traversal_chunk, top_level_ranges): # in source order
+            traversal_stats["visited"] += chunk_stats["visited"]
+            traversal_stats["skipped"] += chunk_stats["skipped"]
+            for symbol in chunk_symbols:
+                count += 1
+                symbol["id"] = "%s#%d" % (target_filename, count) # numbered from 1 in each chunk
+                yield symbol
+        pool.close()
+    finally:
+        pool.terminate() # no-op if closed normally; otherwise, e.g. the consumer stopped early
+        pool.join()
+
+# replace each Type object { spelling, type_info } nested in value with a reference { spelling, type_id },
+# where type_id is the index of the Type object in type_table["types"], which is extended as needed;
+# Type objects are identified by identity, as identical types share one dict (see _collect_type_info)
+def _reference_types(value, type_table):
+    if isinstance(value, dict):
+        if "type_info" in value: # a Type object
+            type_id = type_table["ids"].get(id(value))
+            if type_id == None:
+                type_entry = {
+                    "spelling": value["spelling"],
+                    "type_info": _reference_types(value["type_info"], type_table),
+                }
+                type_id = len(type_table["types"])
+                type_table["types"].append(type_entry)
+                type_table["ids"][id(value)] = type_id
+                type_table["referenced"].append(value) # keep alive, so that id(value) is not reused
+            return { "spelling": value["spelling"], "type_id": type_id }
+        return dict((key, _reference_types(item, type_table)) for key, item in value.items())
+    if isinstance(value, list):
+        return [ _reference_types(item, type_table) for item in value ]
+    return value
+
+def _new_type_table():
+    return {
+        "types": [], # list of Type objects, nested Type objects replaced by references
+        "ids": {},   # dict, key: id() of a Type object, value: index in "types"
+        "referenced": [], # list of the original Type objects
+    }
+
+"""
+Result cache
+"""
+
+# bump this whenever the result schema changes, so that stale cache entries are invalidated
+CACHE_FORMAT_VERSION = 4
+
+def _to_bytes(s):
+    return s if isinstance(s, bytes) else s.encode("utf-8")
+
+_file_digests = {} # key: file path, value: tuple (mtime, size, sha1 hex digest)
+def _get_file_digest(filename, known_digest=None): # return tuple (mtime, size, digest), or None if not found
+    import hashlib
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    # trust the content digest as long as the modification time and the size stay the same
+    for candidate in (known_digest, _file_digests.get(filename)):
+        if candidate and tuple(candidate[:2]) == (stat.st_mtime, stat.st_size):
+            _file_digests[filename] = tuple(candidate)
+            return _file_digests[filename]
+    hasher = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            hasher.update(block)
+    _file_digests[filename] = (stat.st_mtime, stat.st_size, hasher.hexdigest())
+    return _file_digests[filename]
+
+def _get_cache_entry_filename(cache_dir, target_filename):
+    import hashlib
+    key = hashlib.sha1(_to_bytes(os.path.abspath(target_filename))).hexdigest()
+    return os.path.join(cache_dir, key + ".json")
+
+def _make_cache_report(status, reason, changed_files=[]):
+    return {
+        "status": status,        # str, "hit", "miss" or "invalidated"
+        "reason": reason,        # str
+        "changed_files": list(changed_files), # list of str, files changed since cached
+    }
+
+# return tuple (cached result dict or None, cache report dict)
+def _load_cached_result(cache_dir, target_filename, clang_args, result_options):
+    entry_filename = _get_cache_entry_filename(cache_dir, target_filename)
+    try:
+        with open(entry_filename) as f:
+            entry = json.load(f)
+    except (IOError, OSError, ValueError): # not cached, or a corrupted entry
+        return None, _make_cache_report("miss", "not cached")
+    if entry.get("format") != CACHE_FORMAT_VERSION:
+        return None, _make_cache_report("invalidated", "cache format changed")
+    if entry["clang_args"] != clang_args:
+        return None, _make_cache_report("invalidated", "clang args changed")
+    if entry["result_options"] != result_options:
+        return None, _make_cache_report("invalidated", "result options changed")
+    # the dependencies are the target file and every file in its include closure
+    changed_files = []
+    for filename, mtime, size, digest in entry["dependencies"]:
+        file_digest = _get_file_digest(filename, (mtime, size, digest))
+        if not file_digest or file_digest[2] != digest:
+            changed_files.append(filename)
+    if changed_files:
+        return None, _make_cache_report("invalidated", "%d file%s changed" % (
+            len(changed_files), "s" if len(changed_files) > 1 else ""), changed_files)
+    try:
+        os.utime(entry_filename, None) # mark as recently used, see _evict_cache_entries()
+    except OSError:
+        pass
+    return entry["result"], _make_cache_report("hit", "no file changed")
+
+def _store_cached_result(cache_dir, target_filename, clang_args, result_options, dependency_filenames, result,
+                         max_size_mb):
+    dependencies = [] # list of [ path, mtime, size, digest ]
+    for filename in dependency_filenames:
+        file_digest = _get_file_digest(filename)
+        if file_digest:
+            dependencies.append([ filename ] + list(file_digest))
+    entry = {
+        "format": CACHE_FORMAT_VERSION,
+        "target": os.path.abspath(target_filename),
+        "clang_args": clang_args,
+        "result_options": result_options,
+        "dependencies": dependencies,
+        "result": dict((k, v) for k, v in result.items() if k != "cache"),
+    }
+    try:
+        os.makedirs(cache_dir)
+    except OSError: # already exists, possibly created by another worker just now
+        pass
+    entry_filename = _get_cache_entry_filename(cache_dir, target_filename)
+    temp_filename = "%s.%d.tmp" % (entry_filename, os.getpid())
+    with open(temp_filename, 'w') as f:
+        json.dump(entry, f, separators=(',', ':')) # keep the key order of symbol dicts
+    os.rename(temp_filename, entry_filename) # replace atomically, readers never see a partial entry
+    _evict_cache_entries(cache_dir, max_size_mb * 1024 * 1024, os.path.getsize(entry_filename))
+
+_cache_dir_sizes = {} # key: cache dir, value: total size in bytes, as far as this process knows
+def _evict_cache_entries(cache_dir, max_size, added_size):
+    if cache_dir in _cache_dir_sizes:
+        _cache_dir_sizes[cache_dir] += added_size
+        if _cache_dir_sizes[cache_dir] <= max_size:
+            return # skip scanning the directory
+    entries = [] # list of tuple (mtime, size, path)
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError: # removed by another process
+            continue
+        if name.endswith(".json"):
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(entry[1] for entry in entries)
+    if total_size > max_size:
+        # remove the least recently used entries, leaving some headroom to avoid
+        # scanning the directory again on each subsequent store
+        for mtime, size, path in sorted(entries):
+            if total_size <= max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+    _cache_dir_sizes[cache_dir] = total_size
+
+"""
+Precompiled headers
+"""
+
+def _make_pch_report(status, reason):
+    return {
+        "status": status, # str, "reused", "built", "rebuilt" or "failed"
+        "reason": reason, # str
+    }
+
+def _pch_has_error(tu):
+    for diagnostic in tu.diagnostics:
+        if diagnostic.severity >= cindex.Diagnostic.Error:
+            return True
+    return False
+
+def _pch_rejected(tu): # e.g. a header in the PCH has been modified since the PCH was built
+    for diagnostic in tu.diagnostics:
+        if (diagnostic.severity >= cindex.Diagnostic.Fatal
+            and ("precompiled header" in diagnostic.spelling
+                 or "PCH" in diagnostic.spelling or "AST file" in diagnostic.spelling)):
+            return True
+    return False
+
+def _remove_pch(pch_filename):
+    for filename in (pch_filename, pch_filename + ".json"):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+# build a PCH from the prefix header once per set of clang args and reuse it until a file in
+# the prefix header's include closure changes;
+# return tuple (PCH file path or None if failed, list of dependency files, PCH report dict)
+def _get_pch(prefix_header, clang_args, pch_dir, index):
+    import hashlib
+    key = hashlib.sha1(_to_bytes("\0".join([ os.path.abspath(prefix_header) ] + clang_args))).hexdigest()
+    pch_filename = os.path.join(pch_dir, key + ".pch")
+    stamp_filename = pch_filename + ".json" # records the dependencies
+    try:
+        with open(stamp_filename) as f:
+            stamp = json.load(f)
+    except (IOError, OSError, ValueError): # not built yet, or a corrupted stamp
+        stamp = None
+    status = "built"
+    reason = "not built before"
+    if stamp and os.path.isfile(pch_filename):
+        changed_files = []
+        for filename, mtime, size, digest in stamp["dependencies"]:
+            file_digest = _get_file_digest(filename, (mtime, size, digest))
+            if not file_digest or file_digest[2] != digest:
+                changed_files.append(filename)
+        dependency_filenames = [ dependency[0] for dependency in stamp["dependencies"] ]
+        if not changed_files:
+            return pch_filename, dependency_filenames, _make_pch_report("reused", "no file changed")
+        status = "rebuilt"
+        reason = "stale, %d file%s changed" % (len(changed_files), "s" if len(changed_files) > 1 else "")
+    # the source file name is appended to the args by libclang, so it is parsed as a header
+    tu = index.parse(prefix_header, args=clang_args + [ "-x", "c++-header" ],
+                     options=(cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+                              | cindex.TranslationUnit.PARSE_INCOMPLETE))
+    if _pch_has_error(tu):
+        _remove_pch(pch_filename)
+        return None, [], _make_pch_report("failed", "errors in prefix header %s" % prefix_header)
+    dependencies = [] # list of [ path, mtime, size, digest ]
+    for filename in set([ prefix_header ] + [ str(inc.include) for inc in tu.get_includes() ]):
+        file_digest = _get_file_digest(filename)
+        if file_digest:
+            dependencies.append([ filename ] + list(file_digest))
+    try:
+        os.makedirs(pch_dir)
+    except OSError: # already exists
+        pass
+    temp_filename = "%s.%d.tmp" % (pch_filename, os.getpid())
+    try:
+        tu.save(temp_filename)
+    except cindex.TranslationUnitSaveError as e:
+        return None, [], _make_pch_report("failed", "cannot save PCH: %s" % e)
+    os.rename(temp_filename, pch_filename) # replace atomically, other processes may be reading it
+    with open(temp_filename, 'w') as f:
+        json.dump({ "prefix_header": prefix_header, "dependencies": dependencies }, f)
+    os.rename(temp_filename, stamp_filename)
+    return pch_filename, [ dependency[0] for dependency in dependencies ], _make_pch_report(status, reason)
+
+def _get_pch_dir(cache_dir):
+    import tempfile
+    return cache_dir or os.path.join(tempfile.gettempdir(), "ccindex-pch")
+
+"""
+SQLite database
+"""
+
+# bump it if the tables change, so that an old database is not mixed with new rows
+DB_SCHEMA_VERSION = 1
+
+# symbols are identified by their id; every other table refers to the file being indexed,
+# so that re-indexing a file replaces its rows
+_db_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY, time_parsing REAL, time_traversing REAL, summary TEXT);
+CREATE TABLE IF NOT EXISTS symbols (
+    id TEXT PRIMARY KEY, file TEXT NOT NULL, spelling TEXT, kind TEXT, location TEXT,
+    parent_spelling TEXT, parent_kind TEXT, parent_location TEXT,
+    comment TEXT, usage TEXT, data TEXT);
+CREATE TABLE IF NOT EXISTS hierarchy (
+    symbol_id TEXT NOT NULL, file TEXT NOT NULL, depth INTEGER,
+    spelling TEXT, kind TEXT, location TEXT, transparent INTEGER);
+CREATE TABLE IF NOT EXISTS args (
+    symbol_id TEXT NOT NULL, file TEXT NOT NULL, position INTEGER, is_template_arg INTEGER,
+    arg_spelling TEXT, type_spelling TEXT, default_expr TEXT);
+CREATE TABLE IF NOT EXISTS bases (
+    symbol_id TEXT NOT NULL, file TEXT NOT NULL, position INTEGER,
+    spelling TEXT, access TEXT, virtual_inheritance INTEGER, definition_location TEXT);
+CREATE TABLE IF NOT EXISTS types (
+    file TEXT NOT NULL, type_id INTEGER, spelling TEXT, type_info TEXT);
+CREATE TABLE IF NOT EXISTS includes (
+    file TEXT NOT NULL, position INTEGER, header TEXT, included_at TEXT, depth INTEGER);
+CREATE TABLE IF NOT EXISTS diagnostics (
+    file TEXT NOT NULL, position INTEGER, severity TEXT, message TEXT);
+CREATE INDEX IF NOT EXISTS symbols_spelling ON symbols (spelling);
+CREATE INDEX IF NOT EXISTS symbols_kind ON symbols (kind);
+CREATE INDEX IF NOT EXISTS symbols_location ON symbols (location);
+CREATE INDEX IF NOT EXISTS symbols_parent ON symbols (parent_location, parent_spelling);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols (file);
+CREATE INDEX IF NOT EXISTS hierarchy_symbol ON hierarchy (symbol_id);
+CREATE INDEX IF NOT EXISTS hierarchy_file ON hierarchy (file);
+CREATE INDEX IF NOT EXISTS args_symbol ON args (symbol_id);
+CREATE INDEX IF NOT EXISTS args_file ON args (file);
+CREATE INDEX IF NOT EXISTS bases_symbol ON bases (symbol_id);
+CREATE INDEX IF NOT EXISTS bases_spelling ON bases (spelling);
+CREATE INDEX IF NOT EXISTS bases_file ON bases (file);
+CREATE INDEX IF NOT EXISTS types_file ON types (file, type_id);
+CREATE INDEX IF NOT EXISTS includes_file ON includes (file);
+CREATE INDEX IF NOT EXISTS includes_header ON includes (header);
+CREATE INDEX IF NOT EXISTS diagnostics_file ON diagnostics (file);
+"""
+
+# tables whose rows belong to a file, in the order they are cleared and filled
+_db_file_tables = [ "symbols", "hierarchy", "args", "bases", "types", "includes", "diagnostics", "files" ]
+# tables whose rows belong to a symbol's file, which is a header for a header's symbols (see --user-headers)
+_db_symbol_tables = [ "symbols", "hierarchy", "args", "bases" ]
+
+# the symbol fields stored in columns of their own, the others are stored as JSON in column "data"
+_db_symbol_columns = [ "id", "spelling", "kind", "location", "parent_kind", "comment", "usage" ]
+
+def _open_db(db_filename):
+    import sqlite3
+    connection = sqlite3.connect(db_filename)
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, DB_SCHEMA_VERSION):
+        connection.close()
+        raise RuntimeError("database %s has schema version %d, expected %d" % (
+            db_filename, version, DB_SCHEMA_VERSION))
+    connection.executescript(_db_schema)
+    connection.execute("PRAGMA user_version = %d" % DB_SCHEMA_VERSION)
+    return connection
+
+# returns dict, key: table name, value: list of row tuples
+def _new_db_rows():
+    return dict((table, []) for table in _db_file_tables)
+
+def _add_symbol_db_rows(rows, filename, symbol):
+    symbol_id = symbol["id"]
+    hierarchy = symbol.get("hierarchy") or [] # absent if not among the requested fields
+    parent = hierarchy[-1] if hierarchy else {}
+    data = dict((key, value) for key, value in symbol.items() if key not in _db_symbol_columns)
+    rows["symbols"].append((
+        symbol_id, filename, symbol.get("spelling"), symbol.get("kind"), symbol.get("location"),
+        parent.get("spelling"), symbol.get("parent_kind"), parent.get("location"),
+        symbol.get("comment"), symbol.get("usage"), json.dumps(data, sort_keys=True)))
+    for depth, context in enumerate(hierarchy):
+        rows["hierarchy"].append((
+            symbol_id, filename, depth,
+            context["spelling"], context["kind"], context["location"], int(context["transparent"])))
+    for is_template_arg, args_key in ((0, "args_list"), (1, "template_args_list")):
+        for position, arg in enumerate(symbol.get(args_key) or []):
+            rows["args"].append((
+                symbol_id, filename, position, is_template_arg,
+                arg["arg_spelling"], arg["type"]["spelling"], arg["default_expr"]))
+    for position, base in enumerate(symbol.get("base_clause") or []):
+        rows["bases"].append((
+            symbol_id, filename, position, base["spelling"], base["access"],
+            int(base["virtual_inheritance"]), base["definition_location"]))
+
+def _add_summary_db_rows(rows, filename, summary):
+    for position, header in enumerate(summary["includes"]):
+        rows["includes"].append((
+            filename, position, header["file"], header["included_at"], header["depth"]))
+    for position, error in enumerate(summary["errors"]):
+        # "SourceLocation: Severity: Explanation", see schema.md
+        match = re.search(r": (fatal|error|warning|note): ", error)
+        rows["diagnostics"].append((filename, position, match.group(1) if match else None, error))
+    other_fields = dict((key, value) for key, value in summary.items() if key not in ("includes", "errors"))
+    rows["files"].append((
+        filename, summary["time_parsing"], summary["time_traversing"], json.dumps(other_fields, sort_keys=True)))
+
+def _insert_db_rows(connection, rows):
+    for table, table_rows in rows.items():
+        if table_rows:
+            connection.executemany("INSERT INTO %s VALUES (%s)" % (
+                table, ", ".join(["?"] * len(table_rows[0]))), table_rows)
+            del table_rows[:]
+
+# store the records yielded by _generate_result() in one transaction, replacing the rows of the file;
+# rows are inserted DB_INSERT_BATCH_SIZE symbols at a time, so the memory does not grow with the
+# number of symbols; the symbols of a header indexed along with the file (see --user-headers) belong to
+# the header, replacing its rows stored through any file, so that each symbol id is stored once, and
+# their types are inline instead of referencing the file's types; returns the "summary" record
+def _store_to_db(connection, filename, records):
+    rows = _new_db_rows()
+    symbol_count = 0
+    type_count = 0
+    types = [] # list of Type objects so far, only kept to inline the types of the headers' symbols
+    header_filenames = set() # the headers whose rows have been cleared
+    summary = None
+    with connection: # commit if no exception, otherwise roll back
+        for table in _db_file_tables:
+            connection.execute("DELETE FROM %s WHERE file = ?" % table, (filename,))
+        for record_kind, record in records:
+            if record_kind == "symbol":
+                symbol_filename = record.get("file", filename)
+                if symbol_filename != filename:
+                    if symbol_filename not in header_filenames:
+                        header_filenames.add(symbol_filename)
+                        for table in _db_symbol_tables:
+                            connection.execute("DELETE FROM %s WHERE file = ?" % table, (symbol_filename,))
+                    if types:
+                        record = _resolve_types(record, types)
+                _add_symbol_db_rows(rows, symbol_filename, record)
+                symbol_count += 1
+                if symbol_count % DB_INSERT_BATCH_SIZE == 0:
+                    _insert_db_rows(connection, rows)
+            elif record_kind == "types":
+                types += record
+                for type_object in record:
+                    rows["types"].append((
+                        filename, type_count, type_object["spelling"],
+                        json.dumps(type_object["type_info"], sort_keys=True)))
+                    type_count += 1
+            else: # "summary"
+                summary = record
+                _add_summary_db_rows(rows, filename, summary)
+        _insert_db_rows(connection, rows)
+    return summary
+
+# the records of a result dict returned by _get_symbols(), as if yielded by _generate_result()
+def _result_to_records(result):
+    if result.get("types"):
+        yield "types", result["types"]
+    for symbol in result["symbols"]:
+        yield "symbol", symbol
+    yield "summary", dict((key, value) for key, value in result.items() if key not in ("symbols", "types"))
+
+"""
+Profiling
+"""
+
+# the functions timed if profiling is enabled, each being a stage; a stage's time includes the
+# time of the stages it calls, e.g. "_format_func_proto" includes its "_collect_type_info" calls
+profiled_stages = [
+    "_collect_hierarchy",
+    "_format_func_proto",
+    "_format_class_proto",
+    "_collect_type_info",
+    "_get_text_range",
+    "_format_comment",
+    "is_deleted_method",
+    "_build_keyword_index", # the token scan of a file
+    "_collect_errors",   # the diagnostics
+    "_collect_includes",
+]
+# libclang calls made outside of _visit_cursor(), e.g. parsing and walking the AST, are attributed to this
+ffi_calls_outside_symbols = "(outside symbols)"
+
+_profile = None # dict while profiling, see _start_profile()
+
+def _make_profiled_stage(stage_stats, function):
+    active = [ False ] # if True, it is a recursive call, whose time is counted by the outermost call
+    def profiled_function(*args, **kwargs):
+        stage_stats["calls"] += 1
+        if active[0]:
+            return function(*args, **kwargs)
+        active[0] = True
+        start_time = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stage_stats["time"] += time.time() - start_time
+            active[0] = False
+    return profiled_function
+
+# libclang calls made while visiting a cursor are attributed to the cursor's kind
+def _make_profiled_visit_cursor(kinds_stats, function):
+    def profiled_visit_cursor(c, *args, **kwargs):
+        kind = _format_syntax_kind(c.kind) # no libclang call, the kind is stored in the cursor
+        if kind not in kinds_stats:
+            kinds_stats[kind] = { "symbols": 0, "time": 0.0, "ffi_calls": 0 }
+        kinds_stats[kind]["symbols"] += 1
+        _profile["ffi_owner"] = kinds_stats[kind]
+        start_time = time.time()
+        try:
+            return function(c, *args, **kwargs)
+        finally:
+            kinds_stats[kind]["time"] += time.time() - start_time
+            _profile["ffi_owner"] = _profile["outside_stats"]
+    return profiled_visit_cursor
+
+def _make_counted_ffi_function(function):
+    def counted_ffi_function(*args):
+        _profile["ffi_owner"]["ffi_calls"] += 1
+        return function(*args)
+    return counted_ffi_function
+
+# replace the profiled functions of this module and of libclang with wrappers recording the
+# time and number of calls; nothing is recorded, nor slowed down, unless profiling is enabled
+def _start_profile():
+    global _profile
+    _stop_profile() # in case a previous run stopped early
+    module_globals = globals()
+    outside_stats = { "ffi_calls": 0 }
+    _profile = {
+        "stages": {},        # dict, key: stage, value: dict { calls, time }
+        "kinds": {},         # dict, key: symbol kind, value: dict { symbols, time, ffi_calls }
+        "outside_stats": outside_stats,
+        "ffi_owner": outside_stats, # the dict whose "ffi_calls" is incremented by a libclang call
+        "originals": [],     # list of tuple (object, attribute name, original attribute)
+    }
+    for stage in profiled_stages:
+        _profile["stages"][stage] = { "calls": 0, "time": 0.0 }
+        _profile["originals"].append((module_globals, stage, module_globals[stage]))
+        module_globals[stage] = _make_profiled_stage(_profile["stages"][stage], module_globals[stage])
+    _profile["originals"].append((module_globals, "_visit_cursor", _visit_cursor))
+    module_globals["_visit_cursor"] = _make_profiled_visit_cursor(_profile["kinds"], _visit_cursor)
+    # clang.cindex calls every libclang function through cindex.conf.lib
+    _load_libclang() # not yet if no file is parsed before
+    lib = cindex.conf.lib
+    for function_info in getattr(cindex, "functionList", []):
+        ffi_function = getattr(lib, function_info[0], None)
+        if ffi_function != None:
+            _profile["originals"].append((lib, function_info[0], ffi_function))
+            setattr(lib, function_info[0], _make_counted_ffi_function(ffi_function))
+
+# restore the profiled functions, return the profile dict, or None if not profiling
+def _stop_profile():
+    global _profile
+    if _profile == None:
+        return None
+    for owner, name, original in reversed(_profile["originals"]):
+        if isinstance(owner, dict):
+            owner[name] = original
+        else:
+            setattr(owner, name, original)
+    kinds_stats = _profile["kinds"]
+    ffi_calls_by_kind = dict((kind, stats["ffi_calls"]) for kind, stats in kinds_stats.items())
+    ffi_calls_by_kind[ffi_calls_outside_symbols] = _profile["outside_stats"]["ffi_calls"]
+    profile = {
+        "stages": _profile["stages"], # dict, key: stage, value: dict { calls, time }
+        "kinds": kinds_stats,         # dict, key: symbol kind, value: dict { symbols, time, ffi_calls }
+        "ffi_calls": sum(ffi_calls_by_kind.values()), # int, number of libclang calls
+        "ffi_calls_outside_symbols": ffi_calls_by_kind[ffi_calls_outside_symbols], # int
+    }
+    _profile = None
+    return profile
+
+def _print_profile(profile):
+    print("[profile] stages, time including nested stages:")
+    for stage, stats in sorted(profile["stages"].items(), key=lambda item: -item[1]["time"]):
+        print("\t%-20s %8d calls %8.3f sec" % (stage, stats["calls"], stats["time"]))
+    print("[profile] symbol kinds:")
+    for kind, stats in sorted(profile["kinds"].items(), key=lambda item: -item[1]["time"]):
+        print("\t%-36s %6d symbols %8.3f sec %8d libclang calls" % (
+            kind, stats["symbols"], stats["time"], stats["ffi_calls"]))
+    print("[profile] %d libclang calls, %d outside symbols (parsing, walking the AST, etc.)" % (
+        profile["ffi_calls"], profile["ffi_calls_outside_symbols"]))
+
+"""
+Warm translation units
+"""
+
+# in server mode, key: tuple (absolute file name, clang args, prefix header), value: warm TU dict,
+# least recently used first; None if not in server mode
+_warm_tus = None
+
+def _make_warm_tu_report(status, reason):
+    return {
+        "status": status, # str, "parsed", "reused" or "reparsed"
+        "reason": reason, # str, why parsed or reparsed
+    }
+
+# return tuple (warm TU dict or None if it has to be parsed, report dict)
+def _get_warm_tu(warm_key):
+    warm_tu = _warm_tus.pop(warm_key, None)
+    if warm_tu == None:
+        return None, _make_warm_tu_report("parsed", "not parsed before")
+    changed_files = [ filename for filename, signature in sorted(warm_tu["signatures"].items())
+                      if _get_file_signature(filename) != signature ]
+    if not changed_files:
+        _warm_tus[warm_key] = warm_tu # re-insert as the most recently used
+        return warm_tu, _make_warm_tu_report("reused", "no file changed")
+    reason = "%d file%s changed" % (len(changed_files), "s" if len(changed_files) > 1 else "")
+    if warm_tu["pch_report"]: # the PCH might be stale, so parse from scratch to rebuild it if needed
+        return None, _make_warm_tu_report("parsed", reason)
+    warm_tu["tu"].reparse() # reads the files from disk again, with the same args
+    _warm_tus[warm_key] = warm_tu
+    return warm_tu, _make_warm_tu_report("reparsed", reason)
+
+def _store_warm_tu(warm_key, tu, parse_args, pch_report, pch_dependency_filenames, dependency_filenames):
+    _warm_tus.pop(warm_key, None)
+    while len(_warm_tus) >= max(WARM_TU_CACHE_SIZE, 1):
+        _warm_tus.popitem(last=False) # evict the least recently used
+    _warm_tus[warm_key] = {
+        "tu": tu, # cindex.TranslationUnit
+        "parse_args": parse_args, # list of str
+        "pch_report": pch_report, # dict or None
+        "pch_dependency_filenames": pch_dependency_filenames, # list of str
+        # dict, key: file name, value: (mtime, size) when parsed
+        "signatures": dict((filename, _get_file_signature(filename)) for filename in set(dependency_filenames)),
+    }
+
+# drop the warm TUs of the file (or all files if None), return the number of TUs dropped
+def _forget_warm_tus(target_filename=None):
+    if _warm_tus == None:
+        return 0
+    warm_keys = [ warm_key for warm_key in _warm_tus
+                  if target_filename == None or warm_key[0] == os.path.abspath(target_filename) ]
+    for warm_key in warm_keys:
+        del _warm_tus[warm_key]
+    return len(warm_keys)
+
+"""
+Compilation database
+"""
+
+# options followed by a path, made absolute relative to the command's directory; the include directory
+# options are deduplicated, keeping the first occurrence (clang ignores the later ones anyway)
+compile_path_options = ("-I", "-isystem", "-isystem-after", "-cxx-isystem", "-iquote", "-idirafter", "-include",
+                        "-include-pch", "-imacros", "-isysroot", "--sysroot", "-F", "-iframework", "-ivfsoverlay")
+compile_include_dir_options = ("-I", "-isystem", "-isystem-after", "-cxx-isystem", "-iquote", "-idirafter", "-F",
+                               "-iframework")
+# options followed by a value kept as is
+compile_value_options = ("-D", "-U", "-x", "-Xclang", "-target", "-arch", "-Xpreprocessor", "-mllvm", "-Xassembler",
+                         "-Xlinker", "-Xanalyzer", "-iprefix", "-iwithprefix", "-iwithprefixbefore", "-iwithsysroot")
+# options dropped along with their values, and options dropped alone: they are about the outputs
+compile_dropped_value_options = ("-o", "-MF", "-MT", "-MQ", "-MJ")
+compile_dropped_options = ("-c", "-S", "-E", "-M", "-MM", "-MD", "-MMD", "-MP", "-MG")
+# the options above taking a value, longest first, so that an argument joined with its value is split at the
+# longest option it starts with, e.g. "-include-pch" is not "-include" joined with "-pch"
+compile_joined_options = sorted(compile_path_options + compile_value_options + compile_dropped_value_options,
+                                key=len, reverse=True)
+
+# return a list of (option, value or None) from the compile command's arguments, without the compiler,
+# the input files and the output options
+def _split_compile_args(arguments):
+    option_pairs = []
+    position = 1 # skip the compiler
+    while position < len(arguments):
+        argument = arguments[position]
+        position += 1
+        if not argument.startswith("-") or argument in compile_dropped_options:
+            continue # an input file, e.g. the source file
+        if argument in compile_dropped_value_options:
+            position += 1
+            continue
+        if argument in compile_path_options or argument in compile_value_options:
+            if position < len(arguments):
+                option_pairs.append((argument, arguments[position]))
+            position += 1
+            continue
+        joined_option = None # e.g. "-Iinclude", "-DNDEBUG", "--sysroot=/sdk"
+        for option in compile_joined_options:
+            if argument.startswith(option + "=" if option.startswith("--") else option):
+                joined_option = option
+                break
+        if joined_option in compile_dropped_value_options: # e.g. "-MFdeps.d", "-ofile.o"
+            continue
+        if joined_option:
+            option_pairs.append((joined_option, argument[len(joined_option):].lstrip("=")))
+        else:
+            option_pairs.append((argument, None))
+    return option_pairs
+
+# return the clang args (list of str) of the compile command: paths made absolute, include directories
+# deduplicated, and only the last -D or -U of each macro kept, as it determines the macro's definition
+def _normalize_compile_args(arguments, directory):
+    option_pairs = []
+    for option, value in _split_compile_args(arguments):
+        if option in compile_path_options:
+            value = os.path.normpath(os.path.join(directory, value))
+        option_pairs.append((option, value))
+    last_macro_positions = {} # dict, key: macro name, value: position of its last -D or -U
+    for position, (option, value) in enumerate(option_pairs):
+        if option in ("-D", "-U"):
+            last_macro_positions[value.split("=", 1)[0]] = position
+    clang_args = []
+    seen_include_dirs = set()
+    for position, (option, value) in enumerate(option_pairs):
+        if option in compile_include_dir_options:
+            if (option, value) in seen_include_dirs:
+                continue
+            seen_include_dirs.add((option, value))
+        if option in ("-D", "-U"):
+            if last_macro_positions[value.split("=", 1)[0]] != position:
+                continue
+            clang_args.append(option + value) # one form for each, so that equal args compare equal
+        elif value == None:
+            clang_args.append(option)
+        else:
+            clang_args += [ option, value ]
+    # the system headers, searched after the project's
+    if not any(arg in ("-isysroot", "--sysroot") for arg in clang_args):
+        clang_args += [ "-isysroot", SYSROOT_PATH ]
+    for path in SYS_INCLUDE_PATHS:
+        clang_args += [ "-isystem", path ]
+    return clang_args
+
+_compile_commands = {} # dict, key: compile_commands.json path, value: tuple (signature, see _load_compile_commands())
+
+# load the compile_commands.json (or the one in the directory) with libclang; return dict, key: absolute source
+# file name, value: clang args (list of str), files having identical args share one list; reloaded if changed
+def _load_compile_commands(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, "compile_commands.json")
+    path = os.path.abspath(path)
+    if os.path.basename(path) != "compile_commands.json": # libclang loads it by the directory only
+        raise IOError("compilation database must be named compile_commands.json: %s" % path)
+    signature = _get_file_signature(path)
+    if signature == None:
+        raise IOError("compilation database not found: %s" % path)
+    if path in _compile_commands and _compile_commands[path][0] == signature:
+        return _compile_commands[path][1]
+    _load_libclang() # the flags of a file are looked up before it is parsed
+    try:
+        database = cindex.CompilationDatabase.fromDirectory(os.path.dirname(path))
+    except cindex.CompilationDatabaseError:
+        raise IOError("cannot load compilation database: %s" % path)
+    args_map = {}
+    distinct_args = {} # dict, key: tuple of args, value: the list of args shared by files
+    for command in database.getAllCompileCommands() or []:
+        filename = os.path.normpath(os.path.join(command.directory, command.filename))
+        if filename in args_map:
+            continue # a file compiled more than once, e.g. for two targets: use the first
+        clang_args = _normalize_compile_args(list(command.arguments), command.directory)
+        args_map[filename] = distinct_args.setdefault(tuple(clang_args), clang_args)
+    _compile_commands[path] = (signature, args_map)
+    return args_map
+
+# return the clang args of the file from the compilation databases (a path or a list of paths), or None if
+# the file is not in them
+def _get_compile_args(compile_commands, target_filename):
+    if not compile_commands:
+        return None
+    if not isinstance(compile_commands, list):
+        compile_commands = [ compile_commands ]
+    target_filename = os.path.abspath(target_filename)
+    for path in compile_commands:
+        clang_args = _load_compile_commands(path).get(target_filename)
+        if clang_args != None:
+            return list(clang_args)
+    return None
+
+# the user include paths in the clang args (those not added as system headers), for telling user headers apart
+def _get_compile_user_include_paths(clang_args):
+    return [ clang_args[i + 1] for i in range(len(clang_args) - 1)
+             if clang_args[i] in ("-I", "-iquote") or (clang_args[i] == "-isystem"
+                                                       and clang_args[i + 1] not in SYS_INCLUDE_PATHS) ]
 
 """
 Input/Output
 """
 
+# raise IOError if any of the include paths is not found
 def _verify_include_paths(include_paths, user_include_paths):
     path_not_found = []
     for path in include_paths:
         if not os.path.isdir(path):
             path_not_found.append(path)
     if len(path_not_found):
-        print("[Error] include path%s not found:" % ("s" if len(path_not_found) > 1 else ""))
-        for path in path_not_found:
-            print("\t%s%s" % (path, " (user provided)" if path in user_include_paths else "(system)"))
-        return False
-    return True
+        raise IOError("include path%s not found:\n%s" % ("s" if len(path_not_found) > 1 else "", '\n'.join(
+            "\t%s%s" % (path, " (user provided)" if path in user_include_paths else "(system)")
+            for path in path_not_found)))
 
 def _is_in_paths(filename, path_list): # check if file is (recursively) in one of the paths
     filename = os.path.abspath(filename)
@@ -816,53 +2192,25 @@ def _is_in_paths(filename, path_list): # check if file is (recursively) in one o
             return True
     return False
 
-def _get_symbols(target_filename, user_include_paths_str, as_library, to_json):
-    include_paths = SYS_INCLUDE_PATHS
-    user_include_paths = []
-    # user include paths
-    if user_include_paths_str: # not empty string
-        user_include_paths = [item.strip() for item in user_include_paths_str.split(',')]
-        include_paths += user_include_paths
-    if not _verify_include_paths(include_paths, user_include_paths):
-        sys.exit(1)
-
-    # check printing
-    print_out = (not as_library) and (not to_json)
-
-    # build index of source
+def _get_clang_args(include_paths):
     clang_args = "-x c++ --std=c++14".split()
     clang_args += ("-isysroot %s" % SYSROOT_PATH).split()
     clang_args += [ "-I" + path for path in include_paths ]
-    index = cindex.Index.create()
+    return clang_args
 
-    start_time = time.time()
-    tu = index.parse(target_filename, args=clang_args,
-                     options=(cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
-                              | cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD))
-    parsing_time = time.time() - start_time
-
-    if print_out:
-        print("[TARGET FILE] %s" % tu.spelling)
-    start_time = time.time()
-    # symbols: [ symbol_dict_1, symbol_dict_2 ]
-    symbols = _traverse_ast(tu.cursor, target_filename, user_include_paths, print_out)
-    traversing_time = time.time() - start_time
-
-    # for any error, it is programmer's responsibility to inspect tu.diagnostics
-    # NOTE especially, if a type is unrecognized (e.g. caused by not including the corresponding header),
-    #      the displayed type spelling will be "int"
-    errors = [] # list error strings
-    error_count = 0
-    for diagnostic in tu.diagnostics:
-        error_count += 1
-        errors.append(str(diagnostic))
-        if print_out:
-            print("[Diagnostic #%d]\n%s" % (error_count, errors[error_count - 1]))
+# for any error, it is programmer's responsibility to inspect tu.diagnostics
+# NOTE especially, if a type is unrecognized (e.g. caused by not including the corresponding header),
+#      the displayed type spelling will be "int"
+def _collect_errors(tu):
+    return [ str(diagnostic) for diagnostic in tu.diagnostics ] # list error strings
 
-    # include stack traverse list, excluding files included by system headers
+# return tuple (include stack traverse list excluding files included by system headers, all included files)
+def _collect_includes(tu, target_filename, user_include_paths):
     include_list = [] # list of dict
+    included_filenames = [] # list of str
     for inc in tu.get_includes():
         included_by = str(inc.location.file) # the file in which the "#include" exists
+        included_filenames.append(str(inc.include))
         # we only want to list files that are 1) included by this target file, or 2) included
         # by a user header (instead of by a system header)
         if (included_by == target_filename
@@ -872,31 +2220,243 @@ def _get_symbols(target_filename, user_include_paths_str, as_library, to_json):
                 "included_at": _format_location(inc.location), # str, the location of "#include"
                 "depth": int(inc.depth),  # int, the file directly included by the target file has depth 1
             })
-    if print_out:
-        print "[includes]\n%s" % '\n'.join([ str(item) for item in include_list ])
-        print("[time parsing] %.2f sec" % parsing_time)
-        print("[time traverse] %.2f sec" % traversing_time)
+    return include_list, included_filenames
+
+# indexer: an Indexer object, holding the options
+def _get_symbols(target_filename, indexer, as_library, to_json=None, to_jsonl=None, to_db=None, to_binary=None):
+    # check printing
+    print_out = (not as_library) and (not to_json) and (not to_jsonl) and (not to_db) and (not to_binary)
+
+    records = _generate_result(target_filename, indexer, print_out)
+    if to_db:
+        connection = _open_db(to_db)
+        try:
+            return _store_to_db(connection, target_filename, records)
+        finally:
+            connection.close()
+    if to_jsonl:
+        # one compact line per record, the memory does not grow with the number of symbols
+        with open(to_jsonl, 'w') as jsonl_file: # overwrite if exists
+            for record_kind, record in records:
+                for line_record in _to_jsonl_records(record_kind, record):
+                    jsonl_file.write(json.dumps(line_record, sort_keys=True, separators=(',', ':')) + "\n")
+        return record # the "summary" record, i.e. all top-level fields except "symbols" and "types"
+
     # build result
-    result = {
-        "symbols": symbols,       # list of symbol dicts
-        "includes": include_list, # list of dict
-        "errors": errors,         # list of error strings
-        "time_parsing": parsing_time,    # float, in seconds
-        "time_traversing": traversing_time # float, in seconds
-    }
+    symbols = [] # list of symbol dicts
+    types = []   # list of Type objects
+    for record_kind, record in records:
+        if record_kind == "symbol":
+            symbols.append(record)
+        elif record_kind == "types":
+            types += record
+        else: # "summary"
+            result = record
+    result["symbols"] = symbols # list of symbol dicts
+    if indexer.type_table:
+        result["types"] = types # list of Type objects
     if to_json:
         with open(to_json, 'w') as json_file: # overwrite if exists
             json.dump(result, json_file, indent=2, sort_keys=True)
+    if to_binary:
+        import ccindex_binary # next to this script, only needed for this output
+        ccindex_binary.write_result(result, to_binary)
     return result
 
+# produce the result piece by piece, so that symbols are consumed as soon as they are visited;
+# yields tuple (record kind, record):
+#   ("symbol", symbol dict) for each symbol,
+#   ("types", list of Type objects) before a symbol that references them first (only if type_table),
+#   ("summary", dict) at last, containing all other top-level fields
+def _generate_result(target_filename, indexer, print_out, lazy=False):
+    # lazy symbols are not cached, profiled, or referencing a type table, as their fields are computed later
+    cache_dir = indexer.cache_dir if not lazy else None
+    type_table = indexer.type_table and not lazy
+    profile = indexer.profile and not lazy
+    pch_prefix = indexer.pch_prefix
+    clang_args, user_include_paths = indexer._get_file_args(target_filename)
+
+    # source files may have been edited since a previous run in this process
+    _refresh_source_buffers()
+
+    # if nothing in the include closure changed since cached, skip parsing and traversing
+    cache_report = None
+    if cache_dir:
+        result, cache_report = _load_cached_result(cache_dir, target_filename, clang_args,
+                                                   indexer._result_options)
+        if result:
+            result["cache"] = cache_report
+            if print_out:
+                print("[TARGET FILE] %s" % target_filename)
+            if result.get("types"):
+                yield "types", result.pop("types")
+            for symbol in result.pop("symbols"):
+                if print_out:
+                    _print_to_stdout(symbol)
+                yield "symbol", symbol
+            if print_out:
+                _print_summary(result)
+            yield "summary", result
+            return
+
+    if profile: # not if the cached result is reused
+        _start_profile()
+
+    # restore the functions wrapped for profiling however it ends, e.g. a parse error or the consumer
+    # stopping early; a no-op if it has been stopped with the profile stored in the result
+    try:
+        index = indexer.get_index()
+
+        start_time = time.time()
+        parse_options = (cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+                         | cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD)
+        tu = None
+        parse_args = clang_args # list of str, with which tu is parsed
+        pch_report = None
+        pch_dependency_filenames = []
+        warm_key = None
+        warm_tu_report = None
+        if _warm_tus != None: # server mode, reuse or reparse the TU kept from a previous request
+            warm_key = (os.path.abspath(target_filename), tuple(clang_args), pch_prefix)
+            warm_tu, warm_tu_report = _get_warm_tu(warm_key)
+            if warm_tu:
+                tu = warm_tu["tu"]
+                parse_args = warm_tu["parse_args"]
+                pch_report = warm_tu["pch_report"]
+                pch_dependency_filenames = warm_tu["pch_dependency_filenames"]
+        if tu == None and pch_prefix:
+            pch_filename, pch_dependency_filenames, pch_report = _get_pch(
+                pch_prefix, clang_args, _get_pch_dir(cache_dir), index)
+            if pch_filename:
+                parse_args = clang_args + [ "-include-pch", pch_filename ]
+                try:
+                    tu = index.parse(target_filename, args=parse_args, options=parse_options)
+                except cindex.TranslationUnitLoadError:
+                    tu = None
+                if tu == None or _pch_rejected(tu):
+                    tu = None
+                    parse_args = clang_args
+                    _remove_pch(pch_filename) # so that the next run builds it again
+                    pch_report = _make_pch_report("failed", "PCH rejected by the compiler, parsed without PCH")
+        if tu == None:
+            tu = index.parse(target_filename, args=clang_args, options=parse_options)
+        parsing_time = time.time() - start_time
+
+        if print_out:
+            print("[TARGET FILE] %s" % tu.spelling)
+        start_time = time.time()
+        traversal_stats = {}
+        # if type_table, each distinct type is emitted once, symbols reference types by index
+        symbol_type_table = _new_type_table() if type_table else None
+        cached_symbols = [] # the cache entry needs all symbols
+        is_indexed_header = None
+        indexed_files = [ target_filename ] # list of str, the files whose symbols are yielded, in order
+        if indexer.user_headers:
+            is_indexed_header = _make_header_filter(target_filename, user_include_paths, indexer.header_owners)
+        # profiling counts this process only; chunks are split by the target file's lines, not the headers'
+        if (indexer.traverse_jobs or 1) > 1 and not lazy and not profile and not is_indexed_header:
+            symbols = _traverse_ast_parallel(tu, parse_args, parse_options, target_filename, user_include_paths,
+                                             traversal_stats, indexer.fields, indexer.skip_comments,
+                                             indexer.traverse_jobs)
+        else:
+            symbols = _traverse_ast(tu.cursor, target_filename, user_include_paths, traversal_stats,
+                                    indexer.fields, lazy, indexer.skip_comments, is_indexed_header=is_indexed_header)
+        for symbol in symbols:
+            if is_indexed_header and symbol["file"] != indexed_files[-1]: # grouped by file
+                indexed_files.append(symbol["file"])
+            if print_out:
+                _print_to_stdout(symbol)
+            if symbol_type_table:
+                known_type_count = len(symbol_type_table["types"])
+                symbol = _reference_types(symbol, symbol_type_table)
+                if len(symbol_type_table["types"]) > known_type_count:
+                    yield "types", symbol_type_table["types"][known_type_count:]
+            if cache_dir:
+                cached_symbols.append(symbol)
+            yield "symbol", symbol
+        traversing_time = time.time() - start_time
+
+        errors = _collect_errors(tu)
+        # the target file, its include closure, and the include closure of the PCH (if any)
+        include_list, dependency_filenames = _collect_includes(tu, target_filename, user_include_paths)
+        dependency_filenames = [ target_filename ] + pch_dependency_filenames + dependency_filenames
+        if warm_key:
+            _store_warm_tu(warm_key, tu, parse_args, pch_report, pch_dependency_filenames, dependency_filenames)
+        # build result, except "symbols" and "types"
+        result = {
+            "includes": include_list, # list of dict
+            "errors": errors,         # list of error strings
+            "time_parsing": parsing_time,    # float, in seconds
+            "time_traversing": traversing_time, # float, in seconds
+            "nodes_visited": traversal_stats["visited"], # int, number of AST nodes visited
+            "nodes_skipped": traversal_stats["skipped"], # int, number of top-level nodes whose subtree is skipped
+        }
+        if is_indexed_header:
+            result["indexed_files"] = indexed_files # list of str
+        if pch_report:
+            result["pch"] = pch_report # dict
+        if warm_tu_report:
+            result["warm_tu"] = warm_tu_report # dict
+        if cache_dir:
+            cached_result = dict(result, symbols=cached_symbols)
+            if symbol_type_table:
+                cached_result["types"] = symbol_type_table["types"]
+            _store_cached_result(cache_dir, target_filename, clang_args, indexer._result_options,
+                                 sorted(set(dependency_filenames)), cached_result,
+                                 indexer.cache_max_size_mb or CACHE_MAX_SIZE_MB)
+            result["cache"] = cache_report # dict
+        if profile:
+            result["profile"] = _stop_profile() # dict
+        if print_out:
+            _print_summary(result)
+        yield "summary", result
+    finally:
+        _stop_profile()
+
+# JSON Lines records: each symbol is a line, and so is each group of Type objects (if any), in the form
+# { "types": [...] }; following the symbols, { "includes": [...] }, { "errors": [...] }, and a line with
+# all other top-level fields (e.g. timing); return a list of dict
+def _to_jsonl_records(record_kind, record):
+    if record_kind == "symbol":
+        return [ record ]
+    if record_kind == "types":
+        return [ { "types": record } ]
+    # "summary"
+    return [
+        { "includes": record["includes"] },
+        { "errors": record["errors"] },
+        dict((key, value) for key, value in record.items() if key not in ("includes", "errors")),
+    ]
+
+def _print_summary(result): # print what follows the symbols
+    for error_count, error in enumerate(result["errors"], 1):
+        print("[Diagnostic #%d]\n%s" % (error_count, error))
+    print("[includes]\n%s" % '\n'.join([ str(item) for item in result["includes"] ]))
+    print("[time parsing] %.2f sec" % result["time_parsing"])
+    print("[time traverse] %.2f sec" % result["time_traversing"])
+    print("[nodes] %d visited, %d top-level skipped" % (result["nodes_visited"], result["nodes_skipped"]))
+    if "pch" in result:
+        print("[pch] %s, %s" % (result["pch"]["status"], result["pch"]["reason"]))
+    if "warm_tu" in result:
+        print("[warm tu] %s, %s" % (result["warm_tu"]["status"], result["warm_tu"]["reason"]))
+    if "cache" in result:
+        print("[cache] %s, %s" % (result["cache"]["status"], result["cache"]["reason"]))
+        for filename in result["cache"]["changed_files"]:
+            print("\t%s" % filename)
+    if "profile" in result:
+        _print_profile(result["profile"])
+
 ordered_keys = [
     "id",          "spelling", "kind",    "hierarchy",
     "parent_kind", "location", "comment", "usage"
 ]
 def _print_to_stdout(symbol):
-    # print keys in ordered_keys first, in order; they are present in all symbol dicts
+    # print keys in ordered_keys first, in order; they are present in all symbol dicts, unless
+    # only some fields are requested
     for key in ordered_keys:
-        if key == "hierarchy":
+        if key not in symbol:
+            continue
+        elif key == "hierarchy":
             if not symbol[key]:
                 print("::::: hierarchy\n(none)")
             else:
@@ -908,7 +2468,7 @@ def _print_to_stdout(symbol):
                     hierarchy_repr_list.append(spelling if not transparent else ("(%s)" % spelling))
                     hierarchy_list.append(symbol[key][i])
                 print("::::: hierarchy\n%s" % ("::" + "::".join(hierarchy_repr_list)))
-                print json.dumps(hierarchy_list, indent=2, sort_keys=True)
+                print(json.dumps(hierarchy_list, indent=2, sort_keys=True))
         elif key == "comment":
             comment = symbol[key]
             print("::::: comment\n%s" % (comment if comment else "(none)"))
@@ -926,49 +2486,822 @@ def _print_to_stdout(symbol):
                     symbol[key]["spelling"], json.dumps(symbol[key]["type_info"], indent=2, sort_keys=True)))
             elif key == "type_alias_chain":
                 print("::::: type_alias_chain:%s" % json.dumps(symbol[key], indent=2, sort_keys=True))
+            elif key == "doxygen":
+                print("::::: doxygen\n%s" % json.dumps(symbol[key], indent=2, sort_keys=True))
             else:
                 print("::::: %s\n%s" % (key, str(value)))
     print("==================")
 
+"""
+Project index
+"""
+
+# bump it if the format of the merged project index changes
+PROJECT_INDEX_FORMAT_VERSION = 1
+
+# the fields that identify and order the declarations of an entity, computed for merging even if only
+# some fields are requested
+project_index_fields = [ "usr", "is_definition", "location", "spelling" ]
+
+# the symbol's id in the project index: its USR, which is the same for all declarations of an entity in
+# any file and run; for a symbol without USR, its location and spelling
+def _get_stable_id(symbol):
+    return symbol.get("usr") or "%s@%s" % (symbol.get("location", ""), symbol.get("spelling", ""))
+
+# the order of file-level symbol ids: by file, then by number, e.g. "a.h#9" before "a.h#10"
+def _get_id_sort_key(symbol_id):
+    filename, _, number = symbol_id.rpartition("#")
+    return filename, int(number)
+
+# the inverse of _reference_types(): replace each reference { spelling, type_id } nested in value with
+# the Type object in types
+def _resolve_types(value, types):
+    if isinstance(value, dict):
+        if "type_id" in value and len(value) == 2: # a reference
+            return {
+                "spelling": value["spelling"],
+                "type_info": _resolve_types(types[value["type_id"]]["type_info"], types),
+            }
+        return dict((key, _resolve_types(item, types)) for key, item in value.items())
+    if isinstance(value, list):
+        return [ _resolve_types(item, types) for item in value ]
+    return value
+
+def _new_project_index():
+    return {
+        "files": {},   # dict, key: target file name, value: its result's top-level fields except "symbols"
+        "symbols": {}, # dict, key: stable id, value: tuple (sort key, symbol dict) of the primary declaration
+        "declarations": {}, # dict, key: stable id, value: list of dict, all declarations of the symbol
+        "docs": {},    # dict, key: stable id, value: tuple (sort key, dict) of the first documented declaration
+        "symbols_before_merge": 0,
+    }
+
+# merge the result of a target file into the project index; declarations of the same entity (the same
+# stable id), e.g. in a header and in the source file defining it, are kept as one symbol: the definition,
+# or else the first declaration by id, documented by the first declaration having a comment; the choice
+# does not depend on the order in which files are merged
+def _merge_result(project_index, target_filename, result):
+    types = result.get("types")
+    project_index["files"][target_filename] = dict(
+        (key, value) for key, value in result.items() if key not in ("symbols", "types"))
+    for symbol in result["symbols"]:
+        if "usr" not in symbol or "location" not in symbol: # otherwise unrelated entities of a name are one
+            raise ValueError("cannot merge %s: symbols lack the fields %s" % (
+                target_filename, ', '.join(project_index_fields)))
+        project_index["symbols_before_merge"] += 1
+        if types != None: # each file has its own type table
+            symbol = _resolve_types(symbol, types)
+        stable_id = _get_stable_id(symbol)
+        sort_key = (not symbol.get("is_definition"), _get_id_sort_key(symbol["id"]))
+        project_index["declarations"].setdefault(stable_id, []).append({
+            "id": symbol["id"], # str, the symbol's id in the target file's result
+            "location": symbol.get("location"), # str
+            "is_definition": symbol.get("is_definition"), # bool
+        })
+        if stable_id not in project_index["symbols"] or sort_key < project_index["symbols"][stable_id][0]:
+            project_index["symbols"][stable_id] = (sort_key, symbol)
+        if symbol.get("comment"):
+            doc_key = _get_id_sort_key(symbol["id"])
+            if stable_id not in project_index["docs"] or doc_key < project_index["docs"][stable_id][0]:
+                project_index["docs"][stable_id] = (doc_key, dict(
+                    (key, symbol[key]) for key in ("comment", "usage", "doxygen") if key in symbol))
+
+# return the merged project index dict, see schema.md
+def _get_project_index_result(project_index):
+    symbols = []
+    for stable_id in sorted(project_index["symbols"]):
+        symbol = dict(project_index["symbols"][stable_id][1], id=stable_id)
+        if stable_id in project_index["docs"]:
+            symbol.pop("doxygen", None)
+            symbol.update(project_index["docs"][stable_id][1])
+        symbol["declarations"] = sorted(project_index["declarations"][stable_id],
+                                        key=lambda declaration: _get_id_sort_key(declaration["id"]))
+        symbols.append(symbol)
+    return {
+        "version": PROJECT_INDEX_FORMAT_VERSION, # int
+        "files": project_index["files"], # dict, key: target file name, value: dict
+        "symbols": symbols, # list of symbol dicts, sorted by id
+        "symbols_before_merge": project_index["symbols_before_merge"], # int
+    }
+
+"""
+Include graph
+"""
+
+# bump it if the format of the stored include graph changes
+INCLUDE_GRAPH_FORMAT_VERSION = 2
+
+# exposed as library interface, a store of the include edges of each target file (translation unit), kept
+# in a JSON file across runs and updated with each result, e.g.
+#     include_graph = ccindex.IncludeGraph("include_graph.json")
+#     for filename, result, failure in ccindex.get_batch(filenames, ["UserIncludeDir1"]):
+#         include_graph.add(filename, result, ["UserIncludeDir1"])
+#     include_graph.save()
+#     include_graph.get_dependent_tus(["path/foo.h"]) # the target files to re-index if foo.h changes
+# the edges are those in a result's "includes", i.e. made by the target file or a user header; file names
+# are stored and returned as absolute paths, and those given are made absolute, relative to the current
+# directory, which should be the one the results were indexed in
+class IncludeGraph(object):
+    def __init__(self, filename=None):
+        self.filename = filename # str or None, where it is loaded from and saved to
+        self._tus = {} # dict, key: target file name, value: dict, see add()
+        self._includers = {} # dict, key: header, value: dict, key: target file name, value: set of includers
+        if filename and os.path.isfile(filename):
+            with open(filename) as f:
+                stored = json.load(f)
+            if stored.get("version") == INCLUDE_GRAPH_FORMAT_VERSION: # otherwise stale, start anew
+                for target_filename, tu in stored["tus"].items():
+                    self._add_tu(target_filename, tu)
+
+    def _add_tu(self, target_filename, tu):
+        self.remove(target_filename)
+        self._tus[target_filename] = tu
+        for included_by, header, _ in tu["includes"]:
+            self._includers.setdefault(header, {}).setdefault(target_filename, set()).add(included_by)
+
+    # record the include edges of the target file's result, replacing those recorded before; headers in
+    # user_include_paths are the ones that the target file may own, see get_header_owners()
+    def add(self, target_filename, result, user_include_paths=[]):
+        target_filename = os.path.abspath(target_filename)
+        includes = [] # list of [ included_by, header, depth ]
+        for include in result["includes"]:
+            included_by = os.path.abspath(include["included_at"].rsplit(":", 2)[0])
+            includes.append([ included_by, os.path.abspath(include["file"]), include["depth"] ])
+        self._add_tu(target_filename, {
+            "includes": includes,
+            "user_headers": sorted(set(header for _, header, _ in includes
+                                       if header != target_filename and _is_in_paths(header, user_include_paths))),
+        })
+
+    def remove(self, target_filename): # forget the target file, e.g. deleted from the project
+        target_filename = os.path.abspath(target_filename)
+        tu = self._tus.pop(target_filename, None)
+        for _, header, _ in (tu["includes"] if tu else []):
+            tu_includers = self._includers.get(header)
+            if tu_includers != None:
+                tu_includers.pop(target_filename, None)
+                if not tu_includers:
+                    del self._includers[header]
+
+    def save(self, filename=None): # overwrite if exists
+        with open(filename or self.filename, 'w') as json_file:
+            json.dump({
+                "version": INCLUDE_GRAPH_FORMAT_VERSION, # int
+                "tus": self._tus, # dict, key: target file name, value: { "includes", "user_headers" }
+            }, json_file, indent=2, sort_keys=True)
+
+    def get_tus(self): # the target files recorded, sorted
+        return sorted(self._tus)
+
+    # the files including the header directly (sorted), in the target files recorded
+    def get_includers(self, header):
+        includers = set()
+        for tu_includers in self._includers.get(os.path.abspath(header), {}).values():
+            includers |= tu_includers
+        return sorted(includers)
+
+    # the target files (sorted) whose results may change if any of the files changes, i.e. those
+    # including one of them directly or indirectly, and those among them
+    def get_dependent_tus(self, filenames):
+        dependent_tus = set()
+        for filename in filenames:
+            filename = os.path.abspath(filename)
+            dependent_tus.update(self._includers.get(filename, {}))
+            if filename in self._tus:
+                dependent_tus.add(filename)
+        return sorted(dependent_tus)
+
+    # return dict, key: a target file or user header, value: the target file through which it is indexed,
+    # so that each file is indexed once; a target file owns itself; a user header goes to the target file
+    # including the most user headers (ties by name), i.e. the one parse covering most of the others
+    def get_header_owners(self):
+        owners = dict((target_filename, target_filename) for target_filename in self._tus)
+        for target_filename in sorted(self._tus, key=lambda tu: (-len(self._tus[tu]["user_headers"]), tu)):
+            for header in self._tus[target_filename]["user_headers"]:
+                owners.setdefault(header, target_filename)
+        return owners
+
+    # the user headers (sorted) indexed through the target file, see get_header_owners()
+    def get_owned_headers(self, target_filename):
+        target_filename = os.path.abspath(target_filename)
+        return sorted(header for header, owner in self.get_header_owners().items()
+                      if owner == target_filename and header != target_filename)
+
 """
 Library interface
 """
 
-# exposed as library interface, returning a dict
-def get(target_filename, user_include_path_list=[]):
-    result = _get_symbols(target_filename=target_filename,
-                          user_include_paths_str=','.join(user_include_path_list),
-                          as_library=True, to_json=None)
-    return result
+# exposed as library interface, an object indexing files with the same options, e.g.
+#     indexer = ccindex.Indexer(["UserIncludeDir1"], cache_dir=".ccindex-cache")
+#     for filename in filenames:
+#         result = indexer.get(filename)
+# it owns its options, clang args and cindex.Index, which are prepared once instead of on each call;
+# the options are as for get(), and read-only once the Indexer is created
+class Indexer(object):
+    def __init__(self, user_include_path_list=[], cache_dir=None, cache_max_size_mb=None, pch_prefix=None,
+                 type_table=False, profile=False, fields=None, skip_comments=False, compile_commands=None,
+                 traverse_jobs=None, user_headers=False, header_owners=None):
+        if fields != None:
+            unknown_fields = [ field for field in fields if field not in symbol_fields ]
+            if unknown_fields:
+                raise ValueError("unknown fields: %s" % ', '.join(unknown_fields))
+        self.user_include_paths = [ path.strip() for path in user_include_path_list ] # list of str
+        self.cache_dir = cache_dir # str or None
+        self.cache_max_size_mb = cache_max_size_mb # int or None
+        self.pch_prefix = pch_prefix # str or None
+        self.type_table = bool(type_table)
+        self.profile = bool(profile)
+        self.fields = list(fields) if fields != None else None # list of str or None
+        self.skip_comments = bool(skip_comments)
+        if compile_commands and not isinstance(compile_commands, list):
+            compile_commands = [ compile_commands ]
+        self.compile_commands = compile_commands or None # list of str or None
+        self.traverse_jobs = traverse_jobs # int or None
+        self.user_headers = bool(user_headers)
+        self.header_owners = header_owners # dict or None, see IncludeGraph.get_header_owners()
+        # a new list, so that SYS_INCLUDE_PATHS does not grow (the clang args are part of the cache key)
+        include_paths = SYS_INCLUDE_PATHS + self.user_include_paths
+        _verify_include_paths(include_paths, self.user_include_paths)
+        self._default_clang_args = _get_clang_args(include_paths)
+        # options that change the result, besides the clang args
+        self._result_options = {
+            "type_table": self.type_table,
+            "fields": sorted(self.fields) if self.fields != None else None,
+            "skip_comments": self.skip_comments,
+            # the PCH's dependencies are checked as the file's, but a result parsed without it is not reused
+            "pch_prefix": os.path.abspath(self.pch_prefix) if self.pch_prefix else None,
+        }
+        if self.user_headers: # not in the key otherwise, so that entries cached before stay valid
+            self._result_options["user_headers"] = True
+            self._result_options["header_owners"] = self.header_owners
+        if extra_kind_handlers: # see register_kind_handler()
+            self._result_options["extra_kinds"] = [ [ kind.name, getattr(visit_function, "__name__", None) ]
+                                                    for kind, visit_function in extra_kind_handlers.items() ]
+        self._index = None # cindex.Index, created on first use
+
+    # the arguments to create an equal Indexer, e.g. in a worker process
+    def get_options(self):
+        return {
+            "user_include_path_list": self.user_include_paths,
+            "cache_dir": self.cache_dir,
+            "cache_max_size_mb": self.cache_max_size_mb,
+            "pch_prefix": self.pch_prefix,
+            "type_table": self.type_table,
+            "profile": self.profile,
+            "fields": self.fields,
+            "skip_comments": self.skip_comments,
+            "compile_commands": self.compile_commands,
+            "traverse_jobs": self.traverse_jobs,
+            "user_headers": self.user_headers,
+            "header_owners": self.header_owners,
+        }
+
+    def get_index(self):
+        if self._index == None:
+            _load_libclang()
+            self._index = cindex.Index.create()
+        return self._index
+
+    # return tuple (clang args, user include paths) for the file: those in the compilation databases if the
+    # file is there, otherwise the default ones; the clang args are a new list
+    def _get_file_args(self, target_filename):
+        compile_args = _get_compile_args(self.compile_commands, target_filename)
+        if compile_args != None:
+            return compile_args, _get_compile_user_include_paths(compile_args)
+        return list(self._default_clang_args), self.user_include_paths
+
+    # return the result dict, see get()
+    def get(self, target_filename):
+        return _get_symbols(target_filename, self, as_library=True)
+
+    # yield the JSON Lines records, see iter_records()
+    def iter_records(self, target_filename):
+        for record_kind, record in _generate_result(target_filename, self, print_out=False):
+            for line_record in _to_jsonl_records(record_kind, record):
+                yield line_record
+
+    # yield LazySymbol objects, see iter_symbols(); the options cache_dir, type_table, profile and
+    # fields do not apply
+    def iter_symbols(self, target_filename):
+        for record_kind, record in _generate_result(target_filename, self, print_out=False, lazy=True):
+            if record_kind == "symbol":
+                yield record
+
+    # index many files with a pool of worker processes, see get_batch(); files having identical flags
+    # (see compile_commands) are indexed one after another and share one PCH
+    def get_batch(self, target_filenames, jobs=None):
+        import multiprocessing
+        # group the files by flags, in the order each group first appears
+        flag_groups = collections.OrderedDict() # key: tuple of clang args, value: list of file names
+        for filename in target_filenames:
+            flag_groups.setdefault(tuple(self._get_file_args(filename)[0]), []).append(filename)
+        batch_jobs = [ filename for filenames in flag_groups.values() for filename in filenames ]
+        if not batch_jobs:
+            return
+        if self.pch_prefix: # build it once per group here, instead of racing to build it in each worker
+            for group_args in flag_groups:
+                _get_pch(self.pch_prefix, list(group_args), _get_pch_dir(self.cache_dir), self.get_index())
+        jobs = min(jobs or multiprocessing.cpu_count(), len(batch_jobs))
+        if jobs == 1: # no need to pay for worker processes
+            for batch_job in batch_jobs:
+                yield _run_batch_job(batch_job, self)
+            return
+        # files are already indexed in parallel, and worker processes cannot have worker processes
+        worker_options = dict(self.get_options(), traverse_jobs=None)
+        pool = multiprocessing.Pool(processes=jobs, initializer=_init_batch_worker, initargs=(worker_options,))
+        try:
+            for batch_res in pool.imap_unordered(_run_batch_job, batch_jobs):
+                yield batch_res
+            pool.close()
+        finally:
+            pool.terminate() # no-op if closed normally; otherwise, e.g. the consumer stopped early
+            pool.join()
+
+# exposed as library interface, returning a dict; a thin wrapper of Indexer, for indexing one file
+# if cache_dir is given, results are cached there and reused until a file in the include closure changes;
+# if pch_prefix (a header) is given, it is precompiled once and implicitly included in the target file;
+# if type_table is True, each distinct type is stored once in result["types"] and referenced by index;
+# if profile is True, the time and number of calls of each stage are stored in result["profile"];
+# if fields (list of str, e.g. ["spelling", "kind"]) is given, each symbol dict only has those fields and "id",
+# and the other fields are not computed; if skip_comments is True, documentary comments are not extracted,
+# leaving "comment" and "usage" empty; if compile_commands (a compile_commands.json or its directory, or a
+# list of them) is given, the file is parsed with its flags there, instead of user_include_path_list;
+# if traverse_jobs (int) is greater than 1, the file's top-level declarations are split into chunks,
+# traversed by that many worker processes (not with profile or user_headers); with type_table, a type used
+# in many chunks may be stored once per chunk; if user_headers is True, the symbols in the user headers
+# included (directly or indirectly) are indexed too, in the same parse, each having "file", grouped by file
+def get(target_filename, user_include_path_list=[], cache_dir=None, pch_prefix=None, type_table=False,
+        profile=False, fields=None, skip_comments=False, compile_commands=None, traverse_jobs=None,
+        user_headers=False):
+    indexer = Indexer(user_include_path_list, cache_dir=cache_dir, pch_prefix=pch_prefix, type_table=type_table,
+                      profile=profile, fields=fields, skip_comments=skip_comments,
+                      compile_commands=compile_commands, traverse_jobs=traverse_jobs, user_headers=user_headers)
+    return indexer.get(target_filename)
+
+# exposed as library interface, yielding the result piece by piece as dicts, each being a JSON Lines
+# record (see option -jsonl): symbol dicts as soon as they are visited, then the other top-level fields
+def iter_records(target_filename, user_include_path_list=[], cache_dir=None, pch_prefix=None, type_table=False,
+                 profile=False, fields=None, skip_comments=False, compile_commands=None, traverse_jobs=None,
+                 user_headers=False):
+    indexer = Indexer(user_include_path_list, cache_dir=cache_dir, pch_prefix=pch_prefix, type_table=type_table,
+                      profile=profile, fields=fields, skip_comments=skip_comments,
+                      compile_commands=compile_commands, traverse_jobs=traverse_jobs, user_headers=user_headers)
+    return indexer.iter_records(target_filename)
+
+# exposed as library interface, yielding a LazySymbol object (a read-only mapping, like a symbol dict)
+# for each symbol, whose fields are computed when first accessed, e.g. symbol["type"]; only the fields
+# accessed are computed, so it is fast if only a few are needed
+def iter_symbols(target_filename, user_include_path_list=[], pch_prefix=None, compile_commands=None,
+                 user_headers=False):
+    indexer = Indexer(user_include_path_list, pch_prefix=pch_prefix, compile_commands=compile_commands,
+                      user_headers=user_headers)
+    return indexer.iter_symbols(target_filename)
+
+# exposed as library interface, indexing many files with a pool of worker processes;
+# yields tuple (target_filename, result dict or None, failure str or None) in completion order;
+# with compile_commands, files having identical flags are indexed one after another and share one PCH;
+# with user_headers, header_owners (see IncludeGraph.get_header_owners()) keeps each header in one result
+def get_batch(target_filenames, user_include_path_list=[], jobs=None, cache_dir=None, cache_max_size_mb=None,
+              pch_prefix=None, type_table=False, profile=False, fields=None, skip_comments=False,
+              compile_commands=None, user_headers=False, header_owners=None):
+    indexer = Indexer(user_include_path_list, cache_dir=cache_dir, cache_max_size_mb=cache_max_size_mb,
+                      pch_prefix=pch_prefix, type_table=type_table, profile=profile, fields=fields,
+                      skip_comments=skip_comments, compile_commands=compile_commands,
+                      user_headers=user_headers, header_owners=header_owners)
+    return indexer.get_batch(target_filenames, jobs)
+
+# exposed as library interface, merging the results of many files (e.g. from get_batch()) into one project
+# index, in which each entity appears once, with its USR as a stable id; file_results is an iterable of
+# tuples (target_filename, result dict or None, ...), a None result is skipped; returns a dict, see schema.md;
+# raises ValueError if the results lack the fields in project_index_fields, e.g. not among fields= of get()
+def merge_results(file_results):
+    project_index = _new_project_index()
+    for file_result in file_results:
+        if file_result[1] != None:
+            _merge_result(project_index, file_result[0], file_result[1])
+    return _get_project_index_result(project_index)
 
+_batch_indexer = None # Indexer, in a worker process
+def _init_batch_worker(indexer_options):
+    global _batch_indexer
+    _batch_indexer = Indexer(**indexer_options) # with its own index, instead of one forked from the parent
+
+def _run_batch_job(target_filename, indexer=None): # indexer: None in a worker process
+    try:
+        result = (indexer or _batch_indexer).get(target_filename)
+    except Exception as e: # report and carry on with other files
+        return target_filename, None, "%s: %s" % (type(e).__name__, e)
+    except SystemExit:
+        return target_filename, None, "indexing aborted"
+    return target_filename, result, None
+
+source_file_extensions = (".h", ".hh", ".hpp", ".hxx", ".c", ".cc", ".cpp", ".cxx")
+# expand files, directories, glob patterns and compile_commands.json files to a list of files
+def _expand_batch_inputs(items):
+    filenames, unmatched_items = [], []
+    for item in items:
+        if os.path.isdir(item):
+            for dir_path, dir_names, file_names in os.walk(item):
+                dir_names.sort() # deterministic order
+                filenames += [ os.path.join(dir_path, name) for name in sorted(file_names)
+                               if name.endswith(source_file_extensions) ]
+        elif os.path.basename(item) == "compile_commands.json" and os.path.isfile(item):
+            with open(item) as f:
+                for entry in json.load(f):
+                    filenames.append(os.path.join(entry.get("directory", ""), entry["file"]))
+        else:
+            matched = sorted(glob.glob(item))
+            if not matched:
+                unmatched_items.append(item)
+            filenames += matched
+    seen = set()
+    filenames = [ f for f in filenames if not (f in seen or seen.add(f)) ] # dedupe, keep order
+    return filenames, unmatched_items
+
+def _batch_output_filename(output_dir, target_filename):
+    relative_path = os.path.relpath(os.path.abspath(target_filename))
+    if relative_path.startswith(os.pardir): # outside of CWD
+        relative_path = os.path.abspath(target_filename).lstrip(os.sep)
+    return os.path.join(output_dir, relative_path + ".json")
+
+"""
+Server
+"""
+
+# JSON-RPC 2.0 error codes
+rpc_parse_error = -32700
+rpc_invalid_request = -32600
+rpc_method_not_found = -32601
+rpc_invalid_params = -32602
+rpc_indexing_failed = -32000
+
+def _make_rpc_response(request_id, result=None, error_code=None, error_message=None):
+    response = { "jsonrpc": "2.0", "id": request_id }
+    if error_code != None:
+        response["error"] = { "code": error_code, "message": error_message }
+    else:
+        response["result"] = result
+    return response
+
+_server_indexers = {} # dict, key: the options as a JSON str, value: Indexer, reused by requests with equal options
+
+# params: "filename" (required), and optionally "include_paths", "cache_dir", "pch_prefix",
+# "type_table", "profile", "fields", "skip_comments", "compile_commands", "traverse_jobs", "user_headers",
+# overriding the server's
+# commandline options; returns the result dict
+def _rpc_index(params, default_params):
+    params = dict(default_params, **params)
+    if not os.path.isfile(params["filename"]):
+        raise IOError("source file not found: %s" % params["filename"])
+    indexer_options = {
+        "user_include_path_list": params["include_paths"],
+        "cache_dir": params["cache_dir"],
+        "pch_prefix": params["pch_prefix"],
+        "type_table": params["type_table"],
+        "profile": params["profile"],
+        "fields": params["fields"],
+        "skip_comments": params["skip_comments"],
+        "compile_commands": params["compile_commands"],
+        "traverse_jobs": params["traverse_jobs"],
+        "user_headers": params["user_headers"],
+    }
+    indexer_key = json.dumps(indexer_options, sort_keys=True)
+    if indexer_key not in _server_indexers:
+        _server_indexers[indexer_key] = Indexer(**indexer_options)
+    return _server_indexers[indexer_key].get(params["filename"])
+
+# params: "filename" (optional, all files if absent); drop the files' TUs kept in memory
+def _rpc_forget(params, default_params):
+    return { "forgotten": _forget_warm_tus(params.get("filename")) }
+
+def _rpc_status(params, default_params):
+    return {
+        "pid": os.getpid(), # int
+        "warm_tus": [ warm_key[0] for warm_key in _warm_tus ], # list of str, least recently used first
+    }
+
+rpc_methods = {
+    "index": _rpc_index,
+    "forget": _rpc_forget,
+    "status": _rpc_status,
+    "shutdown": lambda params, default_params: {},
+}
+
+# return tuple (response dict or None if the request is a notification, whether to shut down)
+def _handle_rpc_request(request_line, default_params):
+    try:
+        request = json.loads(request_line)
+    except ValueError:
+        return _make_rpc_response(None, error_code=rpc_parse_error, error_message="parse error"), False
+    if not isinstance(request, dict) or "method" not in request:
+        return _make_rpc_response(None, error_code=rpc_invalid_request, error_message="invalid request"), False
+    request_id = request.get("id")
+    method = rpc_methods.get(request["method"])
+    params = request.get("params", {})
+    if method == None:
+        response = _make_rpc_response(request_id, error_code=rpc_method_not_found,
+                                      error_message="method not found: %s" % request["method"])
+    elif not isinstance(params, dict):
+        response = _make_rpc_response(request_id, error_code=rpc_invalid_params,
+                                      error_message="params must be an object")
+    else:
+        try:
+            response = _make_rpc_response(request_id, result=method(params, default_params))
+        except KeyError as e:
+            response = _make_rpc_response(request_id, error_code=rpc_invalid_params,
+                                          error_message="missing param: %s" % e)
+        except Exception as e: # report and carry on with other requests
+            response = _make_rpc_response(request_id, error_code=rpc_indexing_failed,
+                                          error_message="%s: %s" % (type(e).__name__, e))
+        except SystemExit:
+            response = _make_rpc_response(request_id, error_code=rpc_indexing_failed,
+                                          error_message="indexing aborted")
+    if "id" not in request: # a notification, no response
+        response = None
+    return response, request["method"] == "shutdown"
+
+# answer requests, one JSON object per line, until the input ends or "shutdown" is requested;
+# return True if "shutdown" is requested
+def _serve_stream(input_file, output_file, default_params):
+    for request_line in iter(input_file.readline, ""):
+        if not request_line.strip():
+            continue
+        response, shutdown = _handle_rpc_request(request_line, default_params)
+        if response != None:
+            output_file.write(json.dumps(response, sort_keys=True, separators=(',', ':')) + "\n")
+            output_file.flush()
+        if shutdown:
+            return True
+    return False
+
+def _serve_socket(socket_path, default_params):
+    import socket
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(socket_path)
+    except socket.error as e:
+        if e.errno != errno.EADDRINUSE:
+            raise
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except socket.error: # left by a server that did not exit normally
+            os.remove(socket_path)
+            server.bind(socket_path)
+        else:
+            print("[Error] another server is listening on %s" % socket_path)
+            sys.exit(1)
+        finally:
+            probe.close()
+    server.listen(1)
+    try:
+        shutdown = False
+        while not shutdown: # one client at a time, as the TUs are not to be used concurrently
+            connection, _ = server.accept()
+            # separate files, as writing to a read-write text file drops the lines read ahead
+            input_file, output_file = connection.makefile("r"), connection.makefile("w")
+            try:
+                shutdown = _serve_stream(input_file, output_file, default_params)
+            except socket.error: # the client went away
+                pass
+            finally:
+                input_file.close()
+                output_file.close()
+                connection.close()
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+# keep the index and the parsed TUs across requests, and answer JSON-RPC requests on stdin/stdout,
+# or on a Unix socket if socket_path is given
+def _serve(socket_path, default_params):
+    global _warm_tus
+    _warm_tus = collections.OrderedDict()
+    if socket_path:
+        _serve_socket(socket_path, default_params)
+        return
+    response_file = sys.stdout
+    sys.stdout = sys.stderr # stdout is for responses only
+    try:
+        _serve_stream(sys.stdin, response_file, default_params)
+    finally:
+        sys.stdout = response_file
 
 """
 Commandline utility interface
 """
 
 def _get_arg_parser():
+    import argparse
     arg_parser = argparse.ArgumentParser(description="Generate summary of symbols in a C++ source file",
-                                         epilog="if -json is not given, then write result to stdout")
-    arg_parser.add_argument("filename", nargs=1, type=str, default="",
+                                         epilog="if none of -json, -jsonl, -db and -bin is given, then write result to stdout")
+    arg_parser.add_argument("filename", nargs='?', type=str, default="",
                             help="path to file to be parsed")
     arg_parser.add_argument("-i", "--user-include-paths", type=str, default="",
                         help="comma separated list of user include paths, e.g. dir1/dir2,dir3/dir4")
     arg_parser.add_argument("-json", "--to-json", nargs='?', type=str, const="out.json", default=None,
                         help="write to a JSON file (default: out.json)")
+    arg_parser.add_argument("-jsonl", "--to-jsonl", nargs='?', type=str, const="out.jsonl", default=None,
+                        help="write to a JSON Lines file as symbols are visited, one symbol per line, "
+                             "followed by the other fields (default: out.jsonl)")
+    arg_parser.add_argument("-db", "--to-db", nargs='?', type=str, const="out.db", default=None,
+                        help="write to a SQLite database, replacing the file's previous rows; in batch mode, "
+                             "all files are written to it (default: out.db)")
+    arg_parser.add_argument("-bin", "--to-binary", nargs='?', type=str, const="out.ccib", default=None,
+                        help="write to a compact binary file, read by the memory-mapping reader in "
+                             "ccindex_binary.py (default: out.ccib)")
+    arg_parser.add_argument("-b", "--batch", nargs='+', type=str, default=None, metavar="INPUT",
+                        help="index many files in parallel instead of filename; each input is a file, "
+                             "a directory, a glob pattern, or a compile_commands.json")
+    arg_parser.add_argument("-p", "--compile-commands", type=str, default=None,
+                        help="a compile_commands.json or its directory: parse each file in it with its flags, "
+                             "instead of -i and the default flags; in batch mode, a compile_commands.json given "
+                             "as input is also used")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes in batch mode (default: number of CPUs)")
+    arg_parser.add_argument("-o", "--output-dir", type=str, default=None,
+                        help="in batch mode, write one JSON file per source file under this directory")
+    arg_parser.add_argument("--traverse-jobs", type=int, default=None,
+                        help="split the file's top-level declarations into chunks, traversed by this many "
+                             "worker processes, for a huge file (e.g. an amalgamated header); not in batch mode "
+                             "with more than one job")
+    arg_parser.add_argument("-m", "--merge", nargs='?', type=str, const="project.json", default=None,
+                        help="in batch mode, merge the results into one project index JSON file, keeping "
+                             "each entity declared in many files once, keyed by its USR (default: project.json)")
+    arg_parser.add_argument("--user-headers", action="store_true", default=False,
+                        help="also index the user headers that the file includes (directly or indirectly) in the "
+                             "same parse, each symbol having \"file\", grouped by file; in batch mode with "
+                             "--include-graph, each header is indexed through the one file owning it")
+    arg_parser.add_argument("-g", "--include-graph", nargs='?', type=str, const="include_graph.json", default=None,
+                        help="in batch mode, record the include edges of each file in this JSON file, kept "
+                             "across runs (default: include_graph.json)")
+    arg_parser.add_argument("--changed", nargs='+', type=str, default=None, metavar="FILE",
+                        help="with --include-graph, only index the inputs that are or include (directly or "
+                             "indirectly) one of these files, and the inputs not recorded yet")
+    arg_parser.add_argument("--cache-dir", type=str, default=None,
+                        help="reuse results cached in this directory unless the file or its includes changed")
+    arg_parser.add_argument("--cache-max-mb", type=int, default=None,
+                        help="max total size of the cache directory in megabytes (default: %d)" % CACHE_MAX_SIZE_MB)
+    arg_parser.add_argument("--pch-prefix", type=str, default=None,
+                        help="precompile this header (e.g. one including the system headers used by all files) "
+                             "once, and implicitly include it in each file; stored in the cache directory if given")
+    arg_parser.add_argument("--type-table", action="store_true", default=False,
+                        help="in JSON, store each distinct type once in \"types\", referenced by \"type_id\"")
+    arg_parser.add_argument("--serve", action="store_true", default=False,
+                        help="run as a server instead of indexing filename, answering JSON-RPC requests on "
+                             "stdin/stdout and keeping parsed files in memory; other options are the "
+                             "defaults of the requests")
+    arg_parser.add_argument("--socket", type=str, default=None,
+                        help="with --serve, listen on this Unix socket instead of stdin/stdout")
+    arg_parser.add_argument("--fields", type=str, default=None,
+                        help="comma separated list of symbol fields to compute and output (\"id\" is always "
+                             "output), e.g. spelling,kind,hierarchy,location; default: all")
+    arg_parser.add_argument("--no-comments", action="store_true", default=False,
+                        help="do not extract documentary comments, leaving \"comment\" and \"usage\" empty")
+    arg_parser.add_argument("--profile", action="store_true", default=False,
+                        help="record the time and number of calls of each stage, and the number of libclang "
+                             "calls of each symbol kind, in \"profile\"")
     return arg_parser
 
+def _get_fields(fields_str): # return list of str, or None if not given
+    if fields_str == None:
+        return None
+    fields = [ item.strip() for item in fields_str.split(',') if item.strip() ]
+    unknown_fields = [ field for field in fields if field not in symbol_fields ]
+    if unknown_fields:
+        print("[Error] unknown field%s: %s" % ("s" if len(unknown_fields) > 1 else "", ', '.join(unknown_fields)))
+        print("available fields: %s" % ', '.join(symbol_fields))
+        sys.exit(1)
+    return fields
+
+# return an Indexer with the options given in commandline; exit if an include path is not found
+def _make_indexer(args, compile_commands=None, header_owners=None):
+    user_include_path_list = []
+    if args.user_include_paths:
+        user_include_path_list = [item.strip() for item in args.user_include_paths.split(',')]
+    fields = _get_fields(args.fields)
+    if fields != None and args.merge:
+        fields += [ field for field in project_index_fields if field not in fields ]
+    try:
+        return Indexer(user_include_path_list, cache_dir=args.cache_dir, cache_max_size_mb=args.cache_max_mb,
+                       pch_prefix=args.pch_prefix, type_table=args.type_table, profile=args.profile,
+                       fields=fields, skip_comments=args.no_comments,
+                       compile_commands=compile_commands, traverse_jobs=args.traverse_jobs,
+                       user_headers=args.user_headers, header_owners=header_owners)
+    except IOError as e:
+        print("[Error] %s" % e)
+        sys.exit(1)
+
+def _run_batch(args):
+    filenames, unmatched_items = _expand_batch_inputs(args.batch)
+    if unmatched_items:
+        print("[Error] no source file found: %s" % ', '.join(unmatched_items))
+        sys.exit(1)
+    compile_commands = [ item for item in args.batch
+                         if os.path.basename(item) == "compile_commands.json" and os.path.isfile(item) ]
+    if args.compile_commands:
+        compile_commands.insert(0, args.compile_commands)
+    include_graph = IncludeGraph(args.include_graph) if args.include_graph else None
+    # the owners recorded by a previous run; the headers not recorded yet are indexed through every file
+    header_owners = include_graph.get_header_owners() if include_graph and args.user_headers else None
+    indexer = _make_indexer(args, compile_commands, header_owners)
+    if include_graph and args.changed:
+        recorded_tus = set(include_graph.get_tus())
+        dependent_tus = set(include_graph.get_dependent_tus(args.changed))
+        unchanged_count = len(filenames)
+        filenames = [ f for f in filenames
+                      if os.path.abspath(f) in dependent_tus or os.path.abspath(f) not in recorded_tus ]
+        print("[include graph] %d files to index, %d not affected" % (
+            len(filenames), unchanged_count - len(filenames)))
+    failure_count = 0
+    start_time = time.time()
+    db_connection = _open_db(args.to_db) if args.to_db else None # written by this process only
+    project_index = _new_project_index() if args.merge else None
+    batch_results = indexer.get_batch(filenames, args.jobs)
+    for count, (target_filename, result, failure) in enumerate(batch_results, 1):
+        if failure:
+            failure_count += 1
+            print("[%d/%d] %s\n[Error] %s" % (count, len(filenames), target_filename, failure))
+            continue
+        print("[%d/%d] %s: %d symbols, %d errors, %.2f sec%s" % (
+            count, len(filenames), target_filename, len(result["symbols"]), len(result["errors"]),
+            result["time_parsing"] + result["time_traversing"],
+            (" (cache %s)" % result["cache"]["status"]) if "cache" in result else ""))
+        if args.output_dir:
+            output_filename = _batch_output_filename(args.output_dir, target_filename)
+            if not os.path.isdir(os.path.dirname(output_filename)):
+                os.makedirs(os.path.dirname(output_filename))
+            with open(output_filename, 'w') as json_file: # overwrite if exists
+                json.dump(result, json_file, indent=2, sort_keys=True)
+        if db_connection:
+            _store_to_db(db_connection, target_filename, _result_to_records(result))
+        if project_index:
+            _merge_result(project_index, target_filename, result)
+        if include_graph:
+            include_graph.add(target_filename, result, indexer._get_file_args(target_filename)[1])
+    if db_connection:
+        db_connection.close()
+    if include_graph:
+        include_graph.save()
+    if project_index:
+        project_index_result = _get_project_index_result(project_index)
+        with open(args.merge, 'w') as json_file: # overwrite if exists
+            json.dump(project_index_result, json_file, indent=2, sort_keys=True)
+        print("[merge] %d symbols, from %d before merging" % (
+            len(project_index_result["symbols"]), project_index_result["symbols_before_merge"]))
+    print("[time total] %.2f sec" % (time.time() - start_time))
+    if failure_count:
+        sys.exit(1)
+
 if __name__ == "__main__":
     args = _get_arg_parser().parse_args()
+    try:
+        _load_libclang()
+    except ImportError as e:
+        print("[Error] %s" % e)
+        sys.exit(1)
+    if args.compile_commands and not (os.path.isfile(args.compile_commands) or os.path.isfile(
+            os.path.join(args.compile_commands, "compile_commands.json"))):
+        print("[Error] compilation database not found: %s" % args.compile_commands)
+        sys.exit(1)
+    if args.compile_commands and os.path.isfile(args.compile_commands) and (
+            os.path.basename(args.compile_commands) != "compile_commands.json"):
+        print("[Error] compilation database must be named compile_commands.json: %s" % args.compile_commands)
+        sys.exit(1)
+
+    if args.changed and not (args.batch and args.include_graph):
+        print("[Error] --changed needs --batch and --include-graph")
+        sys.exit(1)
+    if args.batch:
+        _run_batch(args)
+        sys.exit(0)
+
+    if args.serve:
+        _serve(args.socket, {
+            "include_paths": [ item.strip() for item in args.user_include_paths.split(',') if item.strip() ],
+            "cache_dir": args.cache_dir,
+            "pch_prefix": args.pch_prefix,
+            "type_table": args.type_table,
+            "profile": args.profile,
+            "fields": _get_fields(args.fields),
+            "skip_comments": args.no_comments,
+            "compile_commands": args.compile_commands,
+            "traverse_jobs": args.traverse_jobs,
+            "user_headers": args.user_headers,
+        })
+        sys.exit(0)
 
-    if len(args.filename) == 0:
+    if not args.filename:
         print("[Error] source file not given")
         sys.exit(1)
-    args.filename = args.filename[0]
     if not os.path.isfile(args.filename):
         print("[Error] source file not found: %s" % args.filename)
         sys.exit(1)
 
     _get_symbols(target_filename=args.filename,
-                 user_include_paths_str=args.user_include_paths,
+                 indexer=_make_indexer(args, args.compile_commands),
                  as_library=False,
-                 to_json=args.to_json)
\ No newline at end of file
+                 to_json=args.to_json,
+                 to_jsonl=args.to_jsonl,
+                 to_db=args.to_db,
+                 to_binary=args.to_binary)
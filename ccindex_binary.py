@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# Author: Haihong L.
+# License: MIT License
+#
+# DESCRIPTION:
+# This is a module that stores the result of ccindex.py in a compact binary
+# format (a string table, fixed-width symbol records, and offsets to the nested
+# blocks), and reads it back by memory-mapping the file: a symbol can be looked
+# up by id, kind or spelling, and only the fields accessed are decoded. It does
+# not need libclang. The format is described in schema.md.
+#
+# USAGE:
+# 1) write, from the commandline or from Python:
+#        ./ccindex.py path/file.[h|cc] -i UserIncludeDir1 -bin out.ccib
+#        ccindex_binary.write_result(ccindex.get("path/file.h"), "out.ccib")
+# 2) read:
+#        import ccindex_binary
+#        with ccindex_binary.open_result("out.ccib") as result:
+#            symbol = result.by_id("path/file.h#3") # a read-only mapping like a symbol dict, or None
+#            for symbol in result.by_kind("method"):
+#                print(symbol["spelling"], symbol["location"])
+#            result.by_spelling("foo"), result[0], len(result), result.summary, result.types
+
+import sys
+import struct, mmap
+try:
+    from collections.abc import Mapping # Python3
+except ImportError:
+    from collections import Mapping # Python2
+
+"""
+Format
+"""
+
+# bump it if the format changes
+BINARY_FORMAT_VERSION = 1
+BINARY_MAGIC = b"CCIB"
+
+# magic, version, symbol count, string count, then the file offsets of: string offsets, string data,
+# symbol records, blocks, id index, spelling index, kind index; then the block offsets of: the summary
+# (all other top-level fields), the types (or NO_BLOCK)
+header_struct = struct.Struct("<4s12I")
+# a fixed-width symbol record: string indexes of the string fields (or NO_STRING if absent), then
+# block offsets of the nested fields (or NO_BLOCK if absent); the other fields are in one dict block
+record_string_fields = ("id", "spelling", "kind", "location", "parent_kind", "comment", "usage")
+record_block_fields = ("hierarchy", "args_list", "type")
+record_struct = struct.Struct("<%dI" % (len(record_string_fields) + len(record_block_fields) + 1))
+NO_STRING = 0xffffffff
+NO_BLOCK = 0xffffffff
+
+tag_struct = struct.Struct("<B")
+uint_struct = struct.Struct("<I")
+int_struct = struct.Struct("<q")
+float_struct = struct.Struct("<d")
+
+# a value in a block starts with a tag byte
+TAG_NULL, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STRING, TAG_LIST, TAG_DICT = range(8)
+
+"""
+Writing
+"""
+
+if sys.version_info[0] >= 3:
+    _text_type, _integer_types = str, (int,)
+else:
+    _text_type, _integer_types = unicode, (int, long) # Python2
+
+def _to_bytes(value):
+    return value.encode("utf-8") if isinstance(value, _text_type) else value
+
+# return the index of the string in the string table, adding it if absent
+def _add_string(strings, value):
+    data = _to_bytes(value)
+    index = strings["indexes"].get(data)
+    if index == None:
+        index = strings["indexes"][data] = len(strings["list"])
+        strings["list"].append(data)
+    return index
+
+# append the encoded value (JSON-compatible) to blocks, a bytearray
+def _encode_value(value, strings, blocks):
+    if value is None:
+        blocks.append(TAG_NULL)
+    elif value is True or value is False:
+        blocks.append(TAG_TRUE if value else TAG_FALSE)
+    elif isinstance(value, _integer_types):
+        blocks.append(TAG_INT)
+        blocks += int_struct.pack(value)
+    elif isinstance(value, float):
+        blocks.append(TAG_FLOAT)
+        blocks += float_struct.pack(value)
+    elif isinstance(value, (bytes, _text_type)):
+        blocks.append(TAG_STRING)
+        blocks += uint_struct.pack(_add_string(strings, value))
+    elif isinstance(value, (list, tuple)):
+        blocks.append(TAG_LIST)
+        blocks += uint_struct.pack(len(value))
+        for item in value:
+            _encode_value(item, strings, blocks)
+    elif isinstance(value, dict):
+        blocks.append(TAG_DICT)
+        blocks += uint_struct.pack(len(value))
+        for key in sorted(value):
+            blocks += uint_struct.pack(_add_string(strings, key))
+            _encode_value(value[key], strings, blocks)
+    else:
+        raise TypeError("cannot store value of type %s" % type(value).__name__)
+
+def _add_block(value, strings, blocks): # return the block offset
+    offset = len(blocks)
+    _encode_value(value, strings, blocks)
+    return offset
+
+def _pad(data): # pad to a multiple of 4 bytes
+    data += b"\0" * (-len(data) % 4)
+
+# return the symbol indexes sorted by the field's string (stable, so equal ones stay in symbol order)
+def _get_sorted_index(records, field_position, strings):
+    string_list = strings["list"]
+    return sorted(range(len(records)), key=lambda i: string_list[records[i][field_position]]
+                  if records[i][field_position] != NO_STRING else b"")
+
+# write the result dict (as returned by ccindex.get()) to the file, overwriting it if exists
+def write_result(result, filename):
+    strings = { "indexes": {}, "list": [] } # the string table
+    blocks = bytearray()
+    records = [] # list of tuples, see record_struct
+    for symbol in result["symbols"]:
+        record = [ (_add_string(strings, symbol[field]) if symbol.get(field) != None else NO_STRING)
+                   for field in record_string_fields ]
+        record += [ (_add_block(symbol[field], strings, blocks) if field in symbol else NO_BLOCK)
+                    for field in record_block_fields ]
+        other_fields = dict((key, value) for key, value in symbol.items()
+                            if key not in record_string_fields and key not in record_block_fields)
+        record.append(_add_block(other_fields, strings, blocks))
+        records.append(record)
+    summary = dict((key, value) for key, value in result.items() if key not in ("symbols", "types"))
+    summary_block = _add_block(summary, strings, blocks)
+    types_block = _add_block(result["types"], strings, blocks) if "types" in result else NO_BLOCK
+    indexes = [ _get_sorted_index(records, record_string_fields.index(field), strings)
+                for field in ("id", "spelling", "kind") ]
+
+    # assemble: header, string offsets, string data, records, blocks, indexes
+    data = bytearray(header_struct.size)
+    string_offsets_pos = len(data)
+    string_offset = 0
+    for string in strings["list"]:
+        data += uint_struct.pack(string_offset)
+        string_offset += len(string)
+    data += uint_struct.pack(string_offset) # the end of the last string
+    string_data_pos = len(data)
+    data += b"".join(strings["list"])
+    _pad(data)
+    records_pos = len(data)
+    for record in records:
+        data += record_struct.pack(*record)
+    blocks_pos = len(data)
+    data += blocks
+    _pad(data)
+    index_positions = []
+    for index in indexes:
+        index_positions.append(len(data))
+        data += struct.pack("<%dI" % len(index), *index)
+    header_struct.pack_into(data, 0, BINARY_MAGIC, BINARY_FORMAT_VERSION, len(records), len(strings["list"]),
+                            string_offsets_pos, string_data_pos, records_pos, blocks_pos,
+                            index_positions[0], index_positions[1], index_positions[2],
+                            summary_block, types_block)
+    with open(filename, 'wb') as f: # overwrite if exists
+        f.write(data)
+
+"""
+Reading
+"""
+
+# a read-only mapping of a symbol's fields, like a symbol dict; each field is decoded from the file
+# when accessed; valid as long as the BinaryResult is open
+class SymbolView(Mapping):
+    __slots__ = [ "_result", "_record", "_other_fields" ]
+
+    def __init__(self, result, record):
+        self._result = result
+        self._record = record # tuple, see record_struct
+        self._other_fields = None # dict, decoded when first needed
+
+    def _get_other_fields(self):
+        if self._other_fields == None:
+            self._other_fields = self._result._decode_block(self._record[-1])
+        return self._other_fields
+
+    def __getitem__(self, field):
+        if field in record_string_fields:
+            string_index = self._record[record_string_fields.index(field)]
+            if string_index == NO_STRING:
+                raise KeyError(field)
+            return self._result._get_string(string_index)
+        if field in record_block_fields:
+            block = self._record[len(record_string_fields) + record_block_fields.index(field)]
+            if block == NO_BLOCK:
+                raise KeyError(field)
+            return self._result._decode_block(block)
+        return self._get_other_fields()[field]
+
+    def __iter__(self):
+        for i, field in enumerate(record_string_fields + record_block_fields):
+            if self._record[i] != NO_STRING: # NO_STRING == NO_BLOCK
+                yield field
+        for field in self._get_other_fields():
+            yield field
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __repr__(self):
+        return "SymbolView(%s)" % self.get("id")
+
+    def to_dict(self):
+        return dict((field, self[field]) for field in self)
+
+# a result file opened for reading; the symbols are in the order they were visited
+class BinaryResult(object):
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < header_struct.size:
+            self.close()
+            raise ValueError("%s: not a ccindex binary result" % filename)
+        header = header_struct.unpack_from(self._data, 0)
+        if header[0] != BINARY_MAGIC or header[1] != BINARY_FORMAT_VERSION:
+            self.close()
+            raise ValueError("%s: not a ccindex binary result of format version %d" % (
+                filename, BINARY_FORMAT_VERSION))
+        (self._symbol_count, self._string_count, self._string_offsets_pos, self._string_data_pos,
+         self._records_pos, self._blocks_pos, self._id_index_pos, self._spelling_index_pos,
+         self._kind_index_pos, self._summary_block, self._types_block) = header[2:]
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._symbol_count
+
+    def __getitem__(self, symbol_index):
+        if symbol_index < 0:
+            symbol_index += self._symbol_count
+        if not 0 <= symbol_index < self._symbol_count:
+            raise IndexError("symbol index out of range")
+        return SymbolView(self, record_struct.unpack_from(
+            self._data, self._records_pos + symbol_index * record_struct.size))
+
+    def __iter__(self):
+        for symbol_index in range(self._symbol_count):
+            yield self[symbol_index]
+
+    @property
+    def summary(self): # dict, all top-level fields except "symbols" and "types"
+        return self._decode_block(self._summary_block)
+
+    @property
+    def types(self): # list of Type objects, or None if the result has no type table
+        return self._decode_block(self._types_block) if self._types_block != NO_BLOCK else None
+
+    def by_id(self, symbol_id): # return a SymbolView, or None if not found
+        symbol_indexes = self._find(self._id_index_pos, record_string_fields.index("id"), symbol_id)
+        return self[symbol_indexes[0]] if symbol_indexes else None
+
+    def by_spelling(self, spelling): # return a list of SymbolView
+        return [ self[i] for i in self._find(self._spelling_index_pos,
+                                             record_string_fields.index("spelling"), spelling) ]
+
+    def by_kind(self, kind): # return a list of SymbolView, e.g. kind "method"
+        return [ self[i] for i in self._find(self._kind_index_pos, record_string_fields.index("kind"), kind) ]
+
+    def _get_string_bytes(self, string_index):
+        start, end = struct.unpack_from("<2I", self._data, self._string_offsets_pos + string_index * 4)
+        return self._data[self._string_data_pos + start:self._string_data_pos + end]
+
+    def _get_string(self, string_index):
+        return self._get_string_bytes(string_index).decode("utf-8")
+
+    # return the key of the symbol at the position of the sorted index
+    def _get_index_key(self, index_pos, field_position, position):
+        symbol_index = uint_struct.unpack_from(self._data, index_pos + position * 4)[0]
+        string_index = uint_struct.unpack_from(
+            self._data, self._records_pos + symbol_index * record_struct.size + field_position * 4)[0]
+        return symbol_index, (self._get_string_bytes(string_index) if string_index != NO_STRING else b"")
+
+    # binary search in the sorted index, return the indexes of the symbols whose field equals value
+    def _find(self, index_pos, field_position, value):
+        key = _to_bytes(value)
+        low, high = 0, self._symbol_count
+        while low < high: # the first position whose key is not less than key
+            middle = (low + high) // 2
+            if self._get_index_key(index_pos, field_position, middle)[1] < key:
+                low = middle + 1
+            else:
+                high = middle
+        symbol_indexes = []
+        for position in range(low, self._symbol_count):
+            symbol_index, position_key = self._get_index_key(index_pos, field_position, position)
+            if position_key != key:
+                break
+            symbol_indexes.append(symbol_index)
+        return symbol_indexes
+
+    def _decode_block(self, block):
+        return self._decode_value(self._blocks_pos + block)[0]
+
+    # return tuple (value, position after it)
+    def _decode_value(self, position):
+        data = self._data
+        tag = tag_struct.unpack_from(data, position)[0]
+        position += 1
+        if tag == TAG_NULL:
+            return None, position
+        elif tag == TAG_FALSE or tag == TAG_TRUE:
+            return tag == TAG_TRUE, position
+        elif tag == TAG_INT:
+            return int_struct.unpack_from(data, position)[0], position + 8
+        elif tag == TAG_FLOAT:
+            return float_struct.unpack_from(data, position)[0], position + 8
+        elif tag == TAG_STRING:
+            return self._get_string(uint_struct.unpack_from(data, position)[0]), position + 4
+        count = uint_struct.unpack_from(data, position)[0]
+        position += 4
+        if tag == TAG_LIST:
+            items = []
+            for _ in range(count):
+                item, position = self._decode_value(position)
+                items.append(item)
+            return items, position
+        elif tag == TAG_DICT:
+            items = {}
+            for _ in range(count):
+                key = self._get_string(uint_struct.unpack_from(data, position)[0])
+                items[key], position = self._decode_value(position + 4)
+            return items, position
+        raise ValueError("corrupted block at offset %d" % position)
+
+def open_result(filename):
+    return BinaryResult(filename)
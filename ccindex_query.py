@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# Author: Haihong L.
+# License: MIT License
+#
+# DESCRIPTION:
+# This is a module that answers queries over the symbols of a result of
+# ccindex.py (or a merged project index, or a binary result), e.g. the
+# symbols with a name prefix, the members of a scope, the classes derived
+# from a class, the overrides of a virtual method, and the symbol at a source
+# location. The indexes are built once, so that each query does not scan all
+# symbols. It does not need libclang.
+#
+# USAGE:
+#        import ccindex, ccindex_query
+#        symbol_index = ccindex_query.SymbolIndex(ccindex.get("path/file.h"))
+#        symbol_index.by_prefix("get"), symbol_index.by_kind("method")
+#        symbol_index.members("ns::C"), symbol_index.by_qualified_name("ns::C::foo")
+#        for method in symbol_index.by_qualified_name("ns::Base::run"):
+#            overriding_methods = symbol_index.overrides(method)
+#        symbol_index.at("path/file.h:12:7"), symbol_index.in_lines("path/file.h", 10, 20)
+# NOTE each symbol returned is the symbol dict (or mapping) in the result, not a copy.
+
+import bisect
+
+"""
+Configs
+"""
+
+class_like_kinds = ("class_declaration", "struct_declaration", "class_template")
+method_kinds = ("method", "destructor", "conversion_function")
+
+"""
+Helpers
+"""
+
+# return tuple (file name, line, column) of a source location str "path/file.h:12:7", or None if empty
+# or not in that form
+def _parse_location(location):
+    parts = (location or "").rsplit(":", 2) # the file name may contain ":"
+    if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    return parts[0], int(parts[1]), int(parts[2])
+
+# the scope path of the symbol: the spellings of all its contexts, e.g. "ns::C" for a method of ns::C;
+# "" in the global scope
+def _get_scope_path(symbol):
+    return "::".join(context["spelling"] for context in symbol.get("hierarchy") or [])
+
+# the name by which the symbol is referred to from the global scope, e.g. "ns::C::foo"; contexts that are
+# transparent (i.e. unscoped enums) are not part of it
+def _get_qualified_name(symbol):
+    names = [ context["spelling"] for context in symbol.get("hierarchy") or [] if not context.get("transparent") ]
+    return "::".join(names + [ symbol.get("spelling", "") ])
+
+# the location of the class-like which the symbol is a member of, or None
+def _get_parent_location(symbol):
+    hierarchy = symbol.get("hierarchy")
+    return hierarchy[-1]["location"] if hierarchy else None
+
+# methods having the same signature key in a base and a derived class-like, if virtual, override
+def _get_signature_key(symbol):
+    if symbol.get("kind") == "destructor":
+        return ("~",) # a destructor overrides the virtual destructor of the base, whatever their names
+    arg_types = tuple((arg.get("type") or {}).get("spelling") for arg in symbol.get("args_list") or [])
+    return symbol.get("spelling"), arg_types, "const" in (symbol.get("method_property") or [])
+
+"""
+Index
+"""
+
+# secondary indexes over the symbols of a result dict or project index dict (its "symbols"), or of an
+# iterable of symbols, e.g. a ccindex_binary.BinaryResult; queries return lists of symbols, in the order
+# of the symbols given; fields missing from the symbols (e.g. not requested with fields=) are treated
+# as empty, so that queries needing them return nothing
+class SymbolIndex(object):
+    def __init__(self, result):
+        symbols = result["symbols"] if isinstance(result, dict) else result
+        self.symbols = list(symbols) # list of symbol dicts (or mappings)
+        self._by_id = {}             # dict, key: id, value: symbol
+        self._by_spelling = {}       # dict, key: spelling, value: list of symbols
+        self._by_kind = {}           # dict, key: kind, value: list of symbols
+        self._by_qualified_name = {} # dict, key: qualified name, value: list of symbols
+        self._by_scope_path = {}     # dict, key: scope path, value: list of symbols, i.e. the members
+        self._by_location = {}       # dict, key: location str, value: list of symbols
+        self._by_parent_location = {} # dict, key: location of the parent context, value: list of symbols
+        self._derived = {}           # dict, key: location of a class-like, value: list of derived class-likes
+        self._positions = {}         # dict, key: file name, value: sorted list of tuple (line, column, symbol order)
+        for order, symbol in enumerate(self.symbols):
+            self._add_symbol(order, symbol)
+        self._spellings = sorted(self._by_spelling) # for prefix search by bisection
+        for positions in self._positions.values():
+            positions.sort()
+
+    def _add_symbol(self, order, symbol):
+        kind = symbol.get("kind")
+        self._by_id[symbol["id"]] = symbol
+        self._by_spelling.setdefault(symbol.get("spelling", ""), []).append(symbol)
+        self._by_kind.setdefault(kind, []).append(symbol)
+        self._by_qualified_name.setdefault(_get_qualified_name(symbol), []).append(symbol)
+        self._by_scope_path.setdefault(_get_scope_path(symbol), []).append(symbol)
+        self._by_parent_location.setdefault(_get_parent_location(symbol), []).append(symbol)
+        # a merged symbol (see ccindex.merge_results()) is at each of its declarations
+        locations = [ declaration["location"] for declaration in symbol.get("declarations") or [] ]
+        for location in locations or [ symbol.get("location") ]:
+            self._by_location.setdefault(location, []).append(symbol)
+            position = _parse_location(location)
+            if position:
+                self._positions.setdefault(position[0], []).append((position[1], position[2], order))
+        if kind in class_like_kinds:
+            for base in symbol.get("base_clause") or []:
+                self._derived.setdefault(base["definition_location"], []).append(symbol)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def by_id(self, symbol_id): # return the symbol, or None if not found
+        return self._by_id.get(symbol_id)
+
+    def by_spelling(self, spelling):
+        return list(self._by_spelling.get(spelling, []))
+
+    # symbols whose spelling starts with prefix, in the order of spelling
+    def by_prefix(self, prefix):
+        symbols = []
+        for spelling_index in range(bisect.bisect_left(self._spellings, prefix), len(self._spellings)):
+            spelling = self._spellings[spelling_index]
+            if not spelling.startswith(prefix):
+                break
+            symbols += self._by_spelling[spelling]
+        return symbols
+
+    def by_kind(self, kind):
+        return list(self._by_kind.get(kind, []))
+
+    # symbols by the name referring to them from the global scope, e.g. "ns::C::foo", or "ns::C" for
+    # both a class's declarations and its definition; an unscoped enum's constants are "foo", not "E::foo"
+    def by_qualified_name(self, qualified_name):
+        return list(self._by_qualified_name.get(qualified_name, []))
+
+    # symbols declared directly in the scope, e.g. "ns::C" (all declarations of the namespace ns are one
+    # scope), "ns::C::E" for an enum's constants, or "" for the global scope
+    def members(self, scope_path):
+        return list(self._by_scope_path.get(scope_path, []))
+
+    def qualified_name(self, symbol):
+        return _get_qualified_name(symbol)
+
+    # the class-likes the class-like symbol inherits directly, which are among the symbols
+    def bases(self, symbol):
+        bases = []
+        for base in symbol.get("base_clause") or []:
+            bases += [ candidate for candidate in self._by_location.get(base["definition_location"], [])
+                       if candidate.get("kind") in class_like_kinds ]
+        return bases
+
+    # the class-likes inheriting the class-like symbol (any of its declarations), directly or, if transitive,
+    # indirectly; each class-like once, a direct one before those derived from it
+    def derived_classes(self, symbol, transitive=False):
+        derived_classes = []
+        seen_ids = set()
+        class_locations = [ candidate.get("location") for candidate in self._by_qualified_name.get(
+            _get_qualified_name(symbol), []) if candidate.get("kind") in class_like_kinds ]
+        while class_locations:
+            next_class_locations = []
+            for class_location in class_locations:
+                for derived_class in self._derived.get(class_location, []):
+                    if derived_class["id"] in seen_ids:
+                        continue # e.g. a diamond
+                    seen_ids.add(derived_class["id"])
+                    derived_classes.append(derived_class)
+                    next_class_locations.append(derived_class.get("location"))
+            class_locations = next_class_locations if transitive else []
+        return derived_classes
+
+    # the methods overriding the virtual method symbol, in the class-likes derived from its class-like,
+    # directly or indirectly; empty if it is not virtual
+    def overrides(self, symbol):
+        if symbol.get("kind") not in method_kinds or "virtual" not in (
+                symbol.get("method_property") or symbol.get("destructor_property") or []):
+            return []
+        signature_key = _get_signature_key(symbol)
+        class_symbols = [ candidate for candidate in self._by_location.get(_get_parent_location(symbol), [])
+                          if candidate.get("kind") in class_like_kinds ]
+        if not class_symbols:
+            return [] # its class-like is not among the symbols
+        overriding_methods = []
+        for derived_class in self.derived_classes(class_symbols[0], transitive=True):
+            overriding_methods += [
+                member for member in self._by_parent_location.get(derived_class.get("location"), [])
+                if member.get("kind") == symbol.get("kind") and _get_signature_key(member) == signature_key ]
+        return overriding_methods
+
+    # the symbols whose name is at the source location "path/file.h:12:7", i.e. a symbol located at the
+    # same line, at or before the column, and not ending before it (results have no extents, so a
+    # symbol is at the location only within its name); empty if the location is not in that form
+    def at(self, location):
+        position = _parse_location(location)
+        if position == None:
+            return []
+        file_name, line, column = position
+        positions = self._positions.get(file_name, [])
+        symbols = []
+        position_index = bisect.bisect_right(positions, (line, column, len(self.symbols)))
+        while position_index > 0:
+            position_index -= 1
+            symbol_line, symbol_column, order = positions[position_index]
+            if symbol_line != line:
+                break
+            symbol = self.symbols[order]
+            if column < symbol_column + max(len(symbol.get("spelling", "")), 1):
+                symbols.append(symbol)
+        symbols.reverse()
+        return symbols
+
+    # the symbols located in the lines [first_line, last_line] of the file, in the order of location
+    def in_lines(self, file_name, first_line, last_line):
+        positions = self._positions.get(file_name, [])
+        start = bisect.bisect_left(positions, (first_line,))
+        end = bisect.bisect_left(positions, (last_line + 1,))
+        return [ self.symbols[order] for _, _, order in positions[start:end] ]